@@ -0,0 +1,98 @@
+# app_resources.py
+#
+# What the Streamlit apps share between reruns:
+#
+# - process-wide singletons (st.cache_resource): the food matcher with its
+#   embedding index, the food lexicon, and the background model warm-up;
+# - per-session memoized pipeline results keyed by a hash of the input, so a
+#   widget click reruns the script without touching the model or the APIs.
+
+import copy
+import hashlib
+import os
+
+import streamlit as st
+
+from entity_extractor import extract_food_entities
+from food_lexicon import load_food_lexicon
+from log_sink import make_meal_id
+from meal_pipeline import new_meal, run_meal_pipeline
+from meal_state import MealState
+from swiss_food_matcher import load_food_database, warm_up
+
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "swiss_food_composition_database_small.csv")
+SESSION_CACHE_SIZE = 8
+
+
+# --- Process-wide singletons ---
+@st.cache_resource(show_spinner=False)
+def start_warm_up(db_path=DB_PATH):
+    """Load the model and index in the background while the first page renders."""
+    return warm_up(db_path)
+
+
+@st.cache_resource(show_spinner="Loading food database...")
+def get_food_db(db_path=DB_PATH):
+    return load_food_database(db_path)
+
+
+@st.cache_resource(show_spinner=False)
+def get_food_lexicon():
+    return load_food_lexicon()
+
+
+# --- Per-session memoization ---
+def input_hash(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def session_memo(key, compute, keep=lambda value: True):
+    """compute() once per session for key; callers get a copy they may mutate.
+    Results for which keep() is false (failures) are returned but not remembered."""
+    cache = st.session_state.setdefault("_memo", {})
+    if key in cache:
+        return copy.deepcopy(cache[key])
+    value = compute()
+    if keep(value):
+        cache[key] = value
+        # Only the last few inputs of this session are kept
+        while len(cache) > SESSION_CACHE_SIZE:
+            cache.pop(next(iter(cache)))
+    return copy.deepcopy(value)
+
+
+def process_audio(data, filename, user_id="anon_user", stages=("ingest", "transcribe", "extract")):
+    """Meal dict for an uploaded recording, from the session cache or the pipeline."""
+    def compute():
+        [meal] = run_meal_pipeline(
+            [new_meal(audio_bytes=data, filename=filename, meal_id=make_meal_id(user_id, data), user_id=user_id)],
+            stages=stages
+        )
+        return meal
+
+    def succeeded(meal):
+        return not meal["error"] and not (meal["raw_extraction"] or "").startswith("Error:")
+
+    return session_memo(("audio", input_hash(data, user_id, *stages)), compute, keep=succeeded)
+
+
+def extract_text(text):
+    """(entities, raw_extraction) for typed meal text, memoized per session."""
+    return session_memo(("text", input_hash(text)), lambda: extract_food_entities(text),
+                        keep=lambda result: not result[1].startswith("Error:"))
+
+
+def get_meal_state(meal_id, transcript, entities):
+    """The session's clarification state for this meal, created on first sight."""
+    states = st.session_state.setdefault("_meal_states", {})
+    state = states.get(meal_id)
+    if state is None:
+        state = MealState(meal_id, transcript, entities)
+        states[meal_id] = state
+        while len(states) > SESSION_CACHE_SIZE:
+            states.pop(next(iter(states)))
+    return state
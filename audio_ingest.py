@@ -0,0 +1,53 @@
+# audio_ingest.py
+
+import io
+import os
+import tempfile
+from contextlib import contextmanager
+
+from pydub import AudioSegment
+
+# What the STT engines want: 16 kHz, mono, 16-bit PCM
+TARGET_FRAME_RATE = 16000
+TARGET_CHANNELS = 1
+TARGET_SAMPLE_WIDTH = 2
+
+
+class IngestedAudio:
+    """One decoded upload; the same WAV bytes feed both the STT upload and st.audio."""
+
+    def __init__(self, wav, duration_ms, source_format):
+        self.wav = wav
+        self.duration_ms = duration_ms
+        self.source_format = source_format
+
+    @contextmanager
+    def temp_file(self):
+        with audio_tempfile(self.wav, suffix=".wav") as path:
+            yield path
+
+
+def ingest_audio(data: bytes, filename: str) -> IngestedAudio:
+    source_format = os.path.splitext(filename)[1].lstrip(".").lower() or None
+    # Decode once, entirely in memory
+    audio = AudioSegment.from_file(io.BytesIO(data), format=source_format)
+    audio = audio.set_frame_rate(TARGET_FRAME_RATE).set_channels(TARGET_CHANNELS).set_sample_width(TARGET_SAMPLE_WIDTH)
+
+    buffer = io.BytesIO()
+    audio.export(buffer, format="wav")
+    return IngestedAudio(buffer.getvalue(), len(audio), source_format)
+
+
+@contextmanager
+def audio_tempfile(data: bytes, suffix=".wav"):
+    """Write audio bytes to a temp file for path-based APIs and always delete it afterwards."""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
+        tmp_file.write(data)
+        tmp_path = tmp_file.name
+    try:
+        yield tmp_path
+    finally:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
@@ -0,0 +1,173 @@
+# batch_process.py
+#
+# Reprocess archived voice logs without the UI, e.g. after a matcher or prompt change:
+#
+#     python batch_process.py mp3_example_files/ --output results.jsonl
+#     python batch_process.py manifest.jsonl --output results.parquet --transcribe-workers 8
+#
+# Input is a directory of recordings, a .txt manifest (one audio path per line) or a
+# .jsonl manifest of {"audio_path": ...} / {"transcript": ...} objects, optionally with
+# "meal_id" and "user_id". Finished meals are appended to a JSONL record file as they
+# complete, which doubles as the checkpoint: rerunning the same command skips meals
+# that already have an error-free record (a failed LLM extraction counts as an error).
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from json_utils import make_json_serializable
+from meal_pipeline import DEFAULT_WORKERS, STAGES, MealLogPipeline, new_meal
+
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".m4a", ".ogg", ".webm", ".flac")
+RECORD_FIELDS = ("meal_id", "user_id", "filename", "transcript", "entities", "raw_extraction", "matches", "timings", "error")
+PROGRESS_EVERY = 25
+
+
+def load_jobs(source, user_id="anon_user"):
+    """Build pipeline jobs from a directory or manifest; meal_id is the source path unless given."""
+    if os.path.isdir(source):
+        paths = sorted(
+            os.path.join(root, name)
+            for root, _, names in os.walk(source)
+            for name in names
+            if name.lower().endswith(AUDIO_EXTENSIONS)
+        )
+        return [new_meal(audio_path=path, meal_id=os.path.relpath(path, source), user_id=user_id) for path in paths]
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    jobs = []
+    with open(source, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            if source.endswith(".jsonl"):
+                entry = json.loads(line)
+            else:
+                entry = {"audio_path": line}
+            audio_path = entry.get("audio_path")
+            if audio_path and not os.path.isabs(audio_path):
+                audio_path = os.path.join(base_dir, audio_path)
+            jobs.append(new_meal(
+                audio_path=audio_path,
+                transcript=entry.get("transcript"),
+                meal_id=str(entry.get("meal_id") or entry.get("audio_path") or f"line_{line_no}"),
+                user_id=entry.get("user_id", user_id),
+            ))
+    return jobs
+
+
+def read_records(records_path):
+    """Latest record per meal_id; a rerun appends, so later lines win."""
+    records = {}
+    if os.path.exists(records_path):
+        with open(records_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # a line cut off by an interrupted run
+                records[record["meal_id"]] = record
+    return records
+
+
+def write_parquet(records, output_path):
+    import pandas as pd
+
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError as e:
+        raise ImportError("Parquet output needs pyarrow: pip install pyarrow") from e
+    df = pd.DataFrame(records, columns=RECORD_FIELDS)
+    # Nested lists/dicts are stored as JSON strings so the file has a flat schema
+    for column in ("entities", "matches", "timings"):
+        df[column] = df[column].map(lambda value: json.dumps(value, default=make_json_serializable))
+    df.to_parquet(output_path, index=False)
+
+
+def _is_done(record):
+    # Records from before extraction failures were reported as errors carry them only in raw_extraction
+    return not record["error"] and not str(record.get("raw_extraction") or "").startswith("Error:")
+
+
+async def process(jobs, pipeline, records_path):
+    started = time.perf_counter()
+    finished = asyncio.Queue()
+    failed = 0
+
+    async def feed():
+        for meal in jobs:
+            # submit() blocks while the first stage's queue is full
+            future = await pipeline.submit(meal)
+            future.add_done_callback(lambda done: finished.put_nowait(done.result()))
+
+    await pipeline.start()
+    feeder = asyncio.create_task(feed())
+    try:
+        with open(records_path, "a", encoding="utf-8") as out:
+            for count in range(1, len(jobs) + 1):
+                meal = await finished.get()
+                record = {key: meal[key] for key in RECORD_FIELDS}
+                out.write(json.dumps(record, default=make_json_serializable) + "\n")
+                out.flush()
+                if meal["error"]:
+                    failed += 1
+                    print(f"❌ {meal['meal_id']}: {meal['error']}", file=sys.stderr)
+                if count % PROGRESS_EVERY == 0 or count == len(jobs):
+                    elapsed = time.perf_counter() - started
+                    print(f"⏱️ {count}/{len(jobs)} meals, {count / elapsed:.2f} files/s", file=sys.stderr)
+        await feeder
+    finally:
+        feeder.cancel()
+        await pipeline.close()
+    return failed, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch-process voice logs or transcripts through the meal pipeline.")
+    parser.add_argument("source", help="Directory of audio files, .txt manifest of paths or .jsonl manifest")
+    parser.add_argument("--output", default="batch_results.jsonl", help="Output file (.jsonl or .parquet)")
+    parser.add_argument("--user-id", default="anon_user")
+    parser.add_argument("--threshold", type=float, default=0.7)
+    parser.add_argument("--queue-size", type=int, default=8)
+    parser.add_argument("--limit", type=int, default=None, help="Process at most this many pending meals")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start over")
+    for stage in STAGES[:-1]:
+        parser.add_argument(f"--{stage}-workers", type=int, default=DEFAULT_WORKERS[stage])
+    args = parser.parse_args()
+
+    parquet = args.output.endswith(".parquet")
+    records_path = args.output + ".partial.jsonl" if parquet else args.output
+    if args.restart and os.path.exists(records_path):
+        os.remove(records_path)
+
+    jobs = load_jobs(args.source, args.user_id)
+    done = {meal_id for meal_id, record in read_records(records_path).items() if _is_done(record)}
+    pending = [meal for meal in jobs if meal["meal_id"] not in done]
+    print(f"📂 {len(jobs)} meals, {len(jobs) - len(pending)} already done, {len(pending)} pending", file=sys.stderr)
+    if args.limit is not None:
+        pending = pending[:args.limit]
+
+    if pending:
+        pipeline = MealLogPipeline(
+            stages=STAGES[:-1],
+            workers={stage: getattr(args, f"{stage}_workers") for stage in STAGES[:-1]},
+            queue_size=args.queue_size,
+            threshold=args.threshold,
+        )
+        failed, elapsed = asyncio.run(process(pending, pipeline, records_path))
+        print(f"✅ {len(pending) - failed} ok, {failed} failed in {elapsed:.1f}s "
+              f"({len(pending) / elapsed:.2f} files/s)", file=sys.stderr)
+        print(json.dumps({"stage_stats": pipeline.stats()}), file=sys.stderr)
+
+    if parquet:
+        records = list(read_records(records_path).values())
+        write_parquet(records, args.output)
+        print(f"💾 Wrote {len(records)} records to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
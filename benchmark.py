@@ -0,0 +1,368 @@
+# benchmark.py
+#
+# End-to-end stage benchmark over the bundled example recordings, with the
+# remote APIs (transcription, LLM extraction) replaced by deterministic stubs:
+#
+#     python benchmark.py --save benchmarks/baseline.json
+#     python benchmark.py --compare benchmarks/baseline.json
+#
+# Every stage reports p50/p95 latency, throughput and the peak RSS of the
+# process while it ran. In-process caches are reset before each call, so the
+# numbers are for the uncached path. --compare exits with status 1 when a
+# stage is slower or larger than the baseline beyond the tolerance.
+#
+# The default "stub" model is a hashing encoder, so the benchmark runs without
+# sentence-transformers; its index is built in a scratch copy of the database
+# and never replaces the real one. Use --model real to time the real model.
+
+import argparse
+import contextlib
+import glob
+import hashlib
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import numpy as np
+
+# The stubbed client never sends it, but entity_extractor needs one at import time
+os.environ.setdefault("OPENAI_API_KEY", "benchmark-stub")
+
+import entity_extractor
+import highlighter
+import swiss_food_matcher
+from audio_ingest import audio_tempfile, ingest_audio
+from entity_extractor import extract_food_entities
+from highlighter import highlight_transcript
+from number_normalizer import normalize_numbers
+from rule_based_extractor import extract_with_rules
+from stt_engines import Transcriber, get_transcriber, register_transcriber
+from swiss_food_matcher import MODEL_NAME, configure_query_cache, load_food_database, match_entity
+from transcript_cache import audio_digest, set_transcript_cache_enabled
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+EXAMPLES_DIR = os.path.join(BASE_DIR, "mp3_example_files")
+DB_PATH = os.path.join(BASE_DIR, "swiss_food_composition_database_small.csv")
+STAGES = ("convert", "transcribe", "extract", "load_food_database", "match", "highlight")
+STUB_MODEL_NAME = "benchmark-hashing-stub"
+
+# Stand-ins for what the recordings say; what matters is that they are fixed and
+# mix simple phrases (rule fast path) with ones that need the (stubbed) LLM
+STUB_TRANSCRIPTS = {
+    "FoodTest1_Elise": "For breakfast I had two slices of bread with some butter and a cup of coffee.",
+    "FoodTest2_JP": "I ate a bowl of muesli with 200 ml milk and a banana.",
+    "FoodTest3_JP": "Lunch was a plate of spaghetti with tomato sauce, a green salad and a glass of water.",
+    "FoodTest4_Elise": "I had an apple, a handful of almonds and later three pieces of dark chocolate.",
+    "FoodTest5_Elise": "For dinner we had roast chicken with potatoes, some carrots and a glass of red wine.",
+}
+DEFAULT_TRANSCRIPT = "I had a cheese sandwich and an orange juice."
+
+
+# --- Deterministic stand-ins for the remote APIs and the model ---
+class StubTranscriber(Transcriber):
+    """Returns a canned transcript per recording, looked up by the audio's digest."""
+
+    name = "stub"
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.transcripts = {}
+
+    def add(self, wav_bytes, transcript):
+        with audio_tempfile(wav_bytes) as path:
+            self.transcripts[audio_digest(path)] = transcript
+
+    def transcribe(self, file_path):
+        time.sleep(self.latency)
+        return self.transcripts.get(audio_digest(file_path), DEFAULT_TRANSCRIPT)
+
+
+class StubChatClient:
+    """Stands in for openai.OpenAI(): answers with the rule extractor's entities, whatever their confidence."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model, messages, temperature=0, **kwargs):
+        time.sleep(self.latency)
+        entities, _ = extract_with_rules(messages[-1]["content"])
+        message = SimpleNamespace(role="assistant", content=json.dumps(entities))
+        return SimpleNamespace(choices=[SimpleNamespace(index=0, message=message)])
+
+
+class HashingEncoder:
+    """Character-trigram hashing in place of the sentence-transformers model."""
+
+    def __init__(self, dim=384):
+        self.dim = dim
+
+    def _encode_one(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        padded = f"  {text.lower()} "
+        for i in range(len(padded) - 2):
+            bucket = int.from_bytes(hashlib.blake2b(padded[i:i + 3].encode("utf-8"), digest_size=4).digest(), "little")
+            vector[bucket % self.dim] += 1.0
+        return vector
+
+    def encode(self, texts, convert_to_numpy=True, normalize_embeddings=True, **kwargs):
+        single = isinstance(texts, str)
+        vectors = np.array([self._encode_one(text) for text in ([texts] if single else texts)], dtype=np.float32)
+        if normalize_embeddings:
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors[0] if single else vectors
+
+
+# --- Measurement ---
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        # No /proc (macOS): fall back to the process-lifetime peak, reported in bytes there
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+class RSSSampler:
+    """Peak resident memory while the with-block runs, sampled from a background thread."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak_mb = max(self.peak_mb, current_rss_mb())
+
+    def __enter__(self):
+        self.peak_mb = current_rss_mb()
+        self._thread = threading.Thread(target=self._sample, name="rss-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, current_rss_mb())
+
+
+def run_stage(inputs, call, reset=None, repeat=1):
+    """Time call(item) for every input, repeat times, with reset() (untimed) before each call."""
+    latencies = []
+    with RSSSampler() as rss, open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeat):
+            for item in inputs:
+                if reset is not None:
+                    reset()
+                started = time.perf_counter()
+                call(item)
+                latencies.append(time.perf_counter() - started)
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "calls": len(latencies),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 3),
+        "mean_ms": round(float(latencies_ms.mean()), 3),
+        "throughput_per_s": round(len(latencies) / sum(latencies), 2) if sum(latencies) else None,
+        "peak_rss_mb": round(rss.peak_mb, 1),
+    }
+
+
+def first_pass(inputs, call):
+    """Run call over inputs once (untimed) to produce the next stage's inputs and warm imports."""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        started = time.perf_counter()
+        outputs = [call(item) for item in inputs]
+    return outputs, (time.perf_counter() - started) * 1000
+
+
+# --- Stages ---
+def _reset_extraction():
+    entity_extractor._extraction_cache.clear()
+
+
+def _reset_database():
+    # What a fresh process pays with the on-disk index already built
+    swiss_food_matcher._open_indexes.clear()
+    swiss_food_matcher._matchers.clear()
+
+
+def _reset_matching():
+    configure_query_cache(max_size=swiss_food_matcher.QUERY_CACHE_SIZE)
+
+
+def _reset_highlighting():
+    normalize_numbers.cache_clear()
+    highlighter._compile.cache_clear()
+
+
+def run_benchmark(files, repeat, model, api_latency):
+    set_transcript_cache_enabled(False)
+    entity_extractor.client = StubChatClient(api_latency)
+    transcriber = register_transcriber(StubTranscriber(api_latency))
+
+    scratch_dir = None
+    if model == "stub":
+        model_name = STUB_MODEL_NAME
+        swiss_food_matcher._models[model_name] = HashingEncoder()
+        # Keep the stub model's embedding index away from the real one
+        scratch_dir = tempfile.mkdtemp(prefix="benchmark-")
+        db_path = shutil.copy(DB_PATH, scratch_dir)
+    else:
+        model_name, db_path = MODEL_NAME, DB_PATH
+
+    stages, first_ms = {}, {}
+    try:
+        recordings = []
+        for path in files:
+            with open(path, "rb") as f:
+                recordings.append((os.path.basename(path), f.read()))
+
+        # Decode and resample to 16 kHz mono WAV
+        convert = lambda recording: ingest_audio(recording[1], recording[0]).wav
+        wavs, first_ms["convert"] = first_pass(recordings, convert)
+        stages["convert"] = run_stage(recordings, convert, repeat=repeat)
+
+        for (filename, _), wav in zip(recordings, wavs):
+            transcriber.add(wav, STUB_TRANSCRIPTS.get(os.path.splitext(filename)[0], DEFAULT_TRANSCRIPT))
+
+        def transcribe(wav):
+            with audio_tempfile(wav) as tmp_path:
+                return get_transcriber(transcriber.name).transcribe(tmp_path)
+
+        transcripts, first_ms["transcribe"] = first_pass(wavs, transcribe)
+        stages["transcribe"] = run_stage(wavs, transcribe, repeat=repeat)
+
+        extract = lambda transcript: extract_food_entities(transcript)[0]
+        extracted, first_ms["extract"] = first_pass(transcripts, extract)
+        stages["extract"] = run_stage(transcripts, extract, _reset_extraction, repeat)
+
+        # The first load builds the embedding index if it is missing; only reloads are timed
+        load = lambda csv_path: load_food_database(csv_path, model_name)
+        (food_db,), first_ms["load_food_database"] = first_pass([db_path], load)
+        stages["load_food_database"] = run_stage([db_path], load, _reset_database, repeat)
+
+        entities = [entity for meal_entities in extracted for entity in meal_entities]
+        match = lambda entity: match_entity(entity, food_db)
+        if entities:
+            _, first_ms["match"] = first_pass(entities, match)
+            stages["match"] = run_stage(entities, match, _reset_matching, repeat)
+
+        highlight = lambda meal: highlight_transcript(normalize_numbers(meal[0]), meal[1])
+        meals = list(zip(transcripts, extracted))
+        _, first_ms["highlight"] = first_pass(meals, highlight)
+        stages["highlight"] = run_stage(meals, highlight, _reset_highlighting, repeat)
+    finally:
+        if scratch_dir is not None:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    for stage, ms in first_ms.items():
+        stages[stage]["first_pass_ms"] = round(ms, 3)
+    return {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "model": model_name,
+        "api_latency_ms": api_latency * 1000,
+        "repeat": repeat,
+        "files": [filename for filename, _ in recordings],
+        "entities": len(entities),
+        "stages": stages,
+    }
+
+
+# --- Reporting and baselines ---
+def print_results(results):
+    print(f"\n{len(results['files'])} recordings, {results['entities']} entities, "
+          f"model {results['model']}, repeat {results['repeat']}")
+    print(f"{'stage':<20}{'calls':>7}{'p50 ms':>11}{'p95 ms':>11}{'calls/s':>11}{'peak RSS MB':>13}")
+    for stage in STAGES:
+        stats = results["stages"].get(stage)
+        if stats is None:
+            print(f"{stage:<20}{'skipped':>7}")
+            continue
+        print(f"{stage:<20}{stats['calls']:>7}{stats['p50_ms']:>11.2f}{stats['p95_ms']:>11.2f}"
+              f"{stats['throughput_per_s'] or 0:>11.1f}{stats['peak_rss_mb']:>13.1f}")
+
+
+def find_regressions(results, baseline, tolerance, min_delta_ms, min_delta_mb):
+    """Human-readable regressions of results against baseline; empty when nothing regressed.
+    A change must exceed both the relative tolerance and the absolute floor, so
+    sub-millisecond stages do not fail on timer noise."""
+    regressions = []
+    for stage, base in baseline["stages"].items():
+        current = results["stages"].get(stage)
+        if current is None:
+            regressions.append(f"{stage}: missing from this run")
+            continue
+        for metric in ("p50_ms", "p95_ms"):
+            if current[metric] > base[metric] * (1 + tolerance) and current[metric] - base[metric] > min_delta_ms:
+                regressions.append(f"{stage}: {metric} {base[metric]:.2f} -> {current[metric]:.2f}")
+        if (base["throughput_per_s"] and current["throughput_per_s"] is not None
+                and current["throughput_per_s"] < base["throughput_per_s"] * (1 - tolerance)
+                and current["mean_ms"] - base["mean_ms"] > min_delta_ms):
+            regressions.append(f"{stage}: throughput {base['throughput_per_s']:.1f}/s -> {current['throughput_per_s']:.1f}/s")
+        if (current["peak_rss_mb"] > base["peak_rss_mb"] * (1 + tolerance)
+                and current["peak_rss_mb"] - base["peak_rss_mb"] > min_delta_mb):
+            regressions.append(f"{stage}: peak RSS {base['peak_rss_mb']:.1f} MB -> {current['peak_rss_mb']:.1f} MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the meal logging stages with stubbed remote APIs.")
+    parser.add_argument("--files", nargs="*", default=None, help="Recordings (default: mp3_example_files/*.mp3)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--model", choices=["stub", "real"], default="stub")
+    parser.add_argument("--api-latency-ms", type=float, default=0.0, help="Fixed delay added to each stubbed API call")
+    parser.add_argument("--save", help="Write the results as a JSON baseline")
+    parser.add_argument("--compare", help="Baseline JSON to compare against; exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown / growth")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0)
+    parser.add_argument("--min-delta-mb", type=float, default=20.0)
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    files = args.files or sorted(glob.glob(os.path.join(EXAMPLES_DIR, "*.mp3")))
+    if not files:
+        raise SystemExit(f"No recordings found in {EXAMPLES_DIR}")
+    results = run_benchmark(files, args.repeat, args.model, args.api_latency_ms / 1000)
+    print_results(results)
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Saved baseline to {args.save}")
+
+    if baseline is not None:
+        # Numbers are only comparable for the same inputs and model
+        for key in ("model", "files", "api_latency_ms"):
+            if baseline.get(key) != results[key]:
+                raise SystemExit(f"❌ Baseline {args.compare} was recorded with {key}={baseline.get(key)!r}, "
+                                 f"this run used {results[key]!r}")
+        regressions = find_regressions(results, baseline, args.tolerance, args.min_delta_ms, args.min_delta_mb)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) against {args.compare}:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            sys.exit(1)
+        print(f"\n✅ No regressions against {args.compare} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# benchmark_stt.py
+#
+# Compares STT engines on the bundled recordings, with the transcript cache off:
+#
+#     python benchmark_stt.py --engines local openai
+#
+# RTF (real-time factor) is processing time divided by audio duration.
+
+import argparse
+import glob
+import os
+import time
+
+from pydub import AudioSegment
+
+from stt_engines import available_transcribers, get_transcriber
+from transcript_cache import set_transcript_cache_enabled
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mp3_example_files")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark STT engines on example recordings.")
+    parser.add_argument("--engines", nargs="+", default=["local"], choices=available_transcribers())
+    parser.add_argument("--files", nargs="*", default=None)
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    set_transcript_cache_enabled(False)
+    files = args.files or sorted(glob.glob(os.path.join(EXAMPLES_DIR, "*.mp3")))
+    durations = {path: len(AudioSegment.from_file(path)) / 1000 for path in files}
+
+    for engine in args.engines:
+        transcriber = get_transcriber(engine)
+        # The first call pays for model loading / connection setup; report it separately
+        started = time.perf_counter()
+        transcriber.transcribe(files[0])
+        print(f"\n== {engine} (first call {time.perf_counter() - started:.2f}s)")
+
+        total_seconds = 0.0
+        for path in files:
+            file_seconds = 0.0
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                text = transcriber.transcribe(path)
+                file_seconds += time.perf_counter() - started
+            total_seconds += file_seconds
+            # Per-file figures are the mean over the repeats
+            elapsed = file_seconds / args.repeat
+            rtf = elapsed / durations[path] if durations[path] else 0.0
+            print(f"{os.path.basename(path)}: {elapsed:.2f}s, RTF {rtf:.2f} – {text[:60]!r}")
+
+        audio_seconds = sum(durations.values()) * args.repeat
+        print(f"total {total_seconds:.2f}s for {audio_seconds:.1f}s of audio, RTF {total_seconds / audio_seconds:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,44 +1,17 @@
 import streamlit as st
-import tempfile
-from pydub import AudioSegment
-from openai_stt import transcribe_with_openai
-from entity_extractor import extract_food_entities
-from swiss_food_matcher import load_food_database, match_entity
+from app_resources import get_food_db, get_food_lexicon, get_meal_state, process_audio, start_warm_up
+from food_lexicon import find_potential_foods
+from highlighter import VAGUE_TERMS, highlight_transcript
+from json_utils import clean_list_for_json, make_json_serializable
+from log_sink import get_log_sink
+from meal_store import get_meal_store
+from number_normalizer import normalize_numbers
 import pandas as pd
-import os
-import requests
 import json
 from datetime import datetime
-import numpy as np
-import re
-
-# --- Load known food words from CSV ---
-def load_known_food_words(csv_path):
-    try:
-        df = pd.read_csv(csv_path)
-        return set(df['food_name'].str.lower().str.strip())
-    except Exception as e:
-        print("⚠️ Failed to load known food words:", e)
-        return set()
-
-csv_foods_path = os.path.join(os.path.dirname(__file__), "csv_foods.csv")
-KNOWN_FOOD_WORDS = load_known_food_words(csv_foods_path)
-
-# --- JSON helpers ---
-def make_json_serializable(obj):
-    if isinstance(obj, np.generic): return obj.item()
-    elif isinstance(obj, (datetime,)): return obj.isoformat()
-    elif isinstance(obj, set): return list(obj)
-    return str(obj)
-
-def clean_list_for_json(data):
-    return json.loads(json.dumps(data, default=make_json_serializable))
-
-# --- Fallback food detection ---
-def find_potential_foods_simple(transcript, known_food_words, extracted_entities):
-    transcript_words = set(re.findall(r'\b\w+\b', transcript.lower()))
-    extracted = {ent["extracted"].lower() for ent in extracted_entities}
-    return [word for word in transcript_words if word in known_food_words and word not in extracted]
+
+# --- Load the matcher model in the background while the page renders ---
+start_warm_up()
 
 # --- Google Sheets logging ---
 def send_to_google_sheets(meal_id, user_id, raw_text, entities, matches, prompts):
@@ -51,58 +24,9 @@ def send_to_google_sheets(meal_id, user_id, raw_text, entities, matches, prompts
         "matches": matches,
         "prompts": prompts,
     }
-    try:
-        cleaned = clean_list_for_json(payload)
-        response = requests.post(url, json=cleaned)
-        response.raise_for_status()
-        print("✅ Logged to Google Sheets:", response.text)
-    except Exception as e:
-        print("❌ Logging failed:", e)
-
-# --- Highlighting ---
-
-from word2number import w2n
-
-def normalize_numbers(text):
-    words = text.split()
-    converted = []
-    for word in words:
-        try:
-            converted.append(str(w2n.word_to_num(word)))
-        except:
-            converted.append(word)
-    return ' '.join(converted)
-
-
-def highlight_transcript(text, entities):
-    text = normalize_numbers(text)  
-    highlighted = text
-    entities_sorted = sorted(entities, key=lambda e: -len(str(e.get("extracted", ""))))
-    vague_terms = {"some", "few", "several", "a", "an"}
-
-    for ent in entities_sorted:
-        food = str(ent.get("extracted", "")).strip()
-        quantity = str(ent.get("quantity", "")).strip()
-        unit = str(ent.get("unit", "")).strip()
-
-        if quantity.lower() in vague_terms:
-            highlighted = re.sub(rf"\b{re.escape(quantity)}\b",
-                                 rf'<span style="background-color:#ffff99;">\g<0></span>', highlighted, flags=re.IGNORECASE)
-        
-        elif quantity and unit:
-            highlighted = re.sub(rf"\b{re.escape(quantity)}\b",
-                         rf'<span style="background-color:#40e0d0;">\g<0></span>', highlighted, flags=re.IGNORECASE)
-            highlighted = re.sub(rf"\b{re.escape(unit)}\b",
-                         rf'<span style="background-color:#40e0d0;">\g<0></span>', highlighted, flags=re.IGNORECASE)
-
-        elif quantity:
-            highlighted = re.sub(rf"\b{re.escape(quantity)}\b",
-                                 rf'<span style="background-color:#40e0d0;">\g<0></span>', highlighted, flags=re.IGNORECASE)
-
-        if food:
-            highlighted = re.sub(rf"\b{re.escape(food)}\b",
-                                 rf'<span style="background-color:#90ee90;">\g<0></span>', highlighted, flags=re.IGNORECASE)
-    return highlighted
+    # Local history first (an upsert by meal_id), then the sheet via a background thread
+    get_meal_store().put(payload)
+    get_log_sink(url).log(payload)
 
 
 # --- Streamlit UI ---
@@ -114,97 +38,56 @@ st.caption("Upload your meal voice log (.mp3, .wav, .ogg, .mp4) to get a transcr
 uploaded_file = st.file_uploader("Upload an audio file", type=["mp3", "wav", "ogg", "mp4"])
 
 if uploaded_file:
-    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(uploaded_file.name)[1]) as tmp_file:
-        tmp_file.write(uploaded_file.read())
-        tmp_path = tmp_file.name
-
-    if tmp_path.endswith((".ogg", ".wav", ".mp4")):
-        audio = AudioSegment.from_file(tmp_path)
-        tmp_path = tmp_path + ".converted.mp3"
-        audio.export(tmp_path, format="mp3")
-
-    wav_path = tmp_path.replace(".mp3", ".wav")
-    AudioSegment.from_file(tmp_path).export(wav_path, format="wav")
-    st.audio(wav_path, format="audio/wav")
-
-    with st.spinner("Transcribing..."):
-        transcript = transcribe_with_openai(tmp_path)
-
+    # Decode once to 16 kHz mono, transcribe and extract in the meal pipeline
+    with st.spinner("Transcribing and extracting food entities..."):
+        meal = process_audio(uploaded_file.getvalue(), uploaded_file.name)
+    if meal["error"]:
+        st.error(f"❌ Processing failed: {meal['error']}")
+        st.stop()
+    # The pipeline drops its audio after transcription; play the upload itself
+    st.audio(uploaded_file.getvalue(), format=uploaded_file.type)
+
+    transcript = meal["transcript"]
+    normalized_transcript = normalize_numbers(transcript)
     st.subheader("Transcript")
     st.write(transcript)
 
-    with st.spinner("Extracting food entities..."):
-        food_entities, raw_llm = extract_food_entities(transcript)
-        st.subheader("Raw LLM Output")
-        st.code(raw_llm)
-        st.markdown("Extracted entities:")
-        st.write(food_entities)
-
-        # CSV-based fallback detection
-        missing_foods = find_potential_foods_simple(transcript, KNOWN_FOOD_WORDS, food_entities)
-        for food in missing_foods:
-            if st.checkbox(f"Include '{food}' even though no quantity was mentioned?"):
-                food_entities.append({
-                    "extracted": food,
-                    "quantity": None,
-                    "unit": None
-                })
+    food_entities, raw_llm = meal["entities"], meal["raw_extraction"]
+    st.subheader("Raw LLM Output")
+    st.code(raw_llm)
+    st.markdown("Extracted entities:")
+    st.write(food_entities)
+
+    # Clarification state lives across reruns; only entities whose inputs change are redone
+    state = get_meal_state(meal["meal_id"], transcript, food_entities)
+
+    # CSV-based fallback detection
+    missing_foods = find_potential_foods(normalized_transcript, food_entities, get_food_lexicon())
+    for food in missing_foods:
+        state.include(food, st.checkbox(f"Include '{food}' even though no quantity was mentioned?"))
 
     # --- Clarification & Matching ---
     st.subheader("Clarify quantities / units + Match foods")
-
-    clarified_entities = []
-    clarification_prompts = []
-    matched_entities = []
-
-    csv_path = os.path.join(os.path.dirname(__file__), "swiss_food_composition_database_small.csv")
-    food_db = load_food_database(csv_path)
-
-    for entity in food_entities:
-        extracted = entity.get("extracted", "")
-        quantity = entity.get("quantity")
-        unit = entity.get("unit")
-
-        if isinstance(quantity, str):
-            q_lower = quantity.lower()
-            if q_lower in ["a", "an", "one"]:
-                quantity = 1
-            elif q_lower in ["some", "few", "several"]:
-                quantity = None
-
-        if quantity in [None, ""]:
-            quantity = st.number_input(
-                f"How much {extracted}? (e.g. 100, 2)",
-                min_value=0.0, step=1.0,
-                key=f"q_input_{extracted}"
-            )
-            clarification_prompts.append({
-                "extracted": extracted,
-                "asked_for": "quantity",
-                "response": quantity
-            })
-
-        if not unit or unit.strip() == "":
-            unit = "portion"
-
-        clarified = {"extracted": extracted, "quantity": quantity, "unit": unit}
-        clarified_entities.append(clarified)
-
-        match = match_entity(clarified, food_db)
-        if not match["recognized"] or match["ID"] is None:
-            correction = st.text_input(
-                f"Food '{extracted}' not recognized. What is it?",
-                key=f"match_correction_{extracted}"
-            )
-            if correction:
-                corrected = match_entity({"extracted": correction}, food_db)
-                corrected["quantity"] = quantity
-                corrected["unit"] = unit
-                matched_entities.append(corrected)
-            else:
-                matched_entities.append(match)
-        else:
-            matched_entities.append(match)
+    food_db = get_food_db()
+
+    for entity in state.active():
+        quantity = entity.given_quantity
+        if entity.needs_quantity:
+            quantity = st.number_input(f"How much {entity.extracted}? (e.g. 100, 2)", min_value=0.0, step=1.0,
+                                       key=f"q_input_{entity.key}")
+        entity.clarify(quantity, entity.given_unit or "portion")
+    state.match_pending(food_db)
+
+    for entity in state.active():
+        if not entity.recognized:
+            correction = st.text_input(f"Food '{entity.extracted}' not recognized. What is it?",
+                                       key=f"match_correction_{entity.key}")
+            entity.correct(correction)
+    state.match_pending(food_db)
+
+    clarified_entities = state.clarified_entities()
+    matched_entities = state.matched_entities()
+    clarification_prompts = state.prompts()
 
     # --- Results ---
     st.subheader("Matched Results")
@@ -213,8 +96,7 @@ if uploaded_file:
 
     # --- Highlighted Transcript ---
     st.subheader("Final Highlighted Transcript")
-    normalized_transcript = normalize_numbers(transcript)
-    st.markdown(highlight_transcript(normalized_transcript, clarified_entities), unsafe_allow_html=True)
+    st.markdown(highlight_transcript(normalized_transcript, clarified_entities, VAGUE_TERMS | {"a", "an"}), unsafe_allow_html=True)
 
 
 
@@ -226,15 +108,17 @@ if uploaded_file:
     </div>
     """, unsafe_allow_html=True)
 
-    # --- Save to Sheets ---
-    send_to_google_sheets(
-        meal_id=f"meal_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
-        user_id="anon_user",
-        raw_text=transcript,
-        entities=clarified_entities,
-        matches=clean_list_for_json(matched_entities),
-        prompts=clarification_prompts
-    )
+    # --- Save to Sheets (only when the meal changed since the last log) ---
+    if state.needs_logging():
+        send_to_google_sheets(
+            meal_id=meal["meal_id"],
+            user_id="anon_user",
+            raw_text=transcript,
+            entities=clarified_entities,
+            matches=clean_list_for_json(matched_entities),
+            prompts=clarification_prompts
+        )
+        state.mark_logged()
 
     # --- Download buttons ---
     st.download_button(
@@ -2,11 +2,20 @@
 import openai
 import os
 import json
+import copy
+import hashlib
+import threading
+from concurrent.futures import Future
 from dotenv import load_dotenv
 
+from lru_cache import LRUCache
+from rule_based_extractor import RULE_CONFIDENCE_THRESHOLD, extract_with_rules
+
 load_dotenv()
 client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
+EXTRACTION_MODEL = "gpt-3.5-turbo"
+
 SYSTEM_PROMPT = """
 You are a nutrition assistant. Extract food items with quantities and units from the given meal description.
 Return a JSON list like this:
@@ -17,10 +26,26 @@ Return a JSON list like this:
 Only return valid JSON.
 """
 
-def extract_food_entities(transcript):
+# Extraction runs at temperature 0, so identical transcripts can share one answer
+PROMPT_HASH = hashlib.sha256(SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:12]
+_extraction_cache = LRUCache(
+    max_size=int(os.getenv("EXTRACTION_CACHE_SIZE", "512")),
+    ttl=float(os.getenv("EXTRACTION_CACHE_TTL", str(24 * 3600))),
+)
+# Concurrent identical requests wait on the first caller's upstream call
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+_deduplicated = 0
+
+
+def _normalize_transcript(transcript):
+    return " ".join(transcript.lower().split())
+
+
+def _call_llm(transcript):
     try:
         response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
+            model=EXTRACTION_MODEL,
             messages=[
                 {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": transcript}
@@ -29,6 +54,52 @@ def extract_food_entities(transcript):
         )
         content = response.choices[0].message.content.strip()
         entities = json.loads(content)
-        return entities, content
+        return entities, content, True
     except Exception as e:
-        return [], f"Error: {str(e)}"
+        return [], f"Error: {str(e)}", False
+
+
+def extract_food_entities(transcript):
+    global _deduplicated
+    # Simple utterances are fully explained by the local rules; skip the LLM round-trip
+    entities, confidence = extract_with_rules(transcript)
+    if entities and confidence >= RULE_CONFIDENCE_THRESHOLD:
+        return entities, json.dumps(entities)
+
+    key = (_normalize_transcript(transcript), EXTRACTION_MODEL, PROMPT_HASH)
+
+    cached = _extraction_cache.get(key)
+    if cached is None:
+        with _in_flight_lock:
+            future = _in_flight.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = Future()
+                _in_flight[key] = future
+            else:
+                _deduplicated += 1
+
+        if is_owner:
+            try:
+                entities, content, ok = _call_llm(transcript)
+                # Errors are returned to the caller but never cached
+                if ok:
+                    _extraction_cache.put(key, (entities, content))
+                future.set_result((entities, content))
+            except BaseException as e:
+                future.set_exception(e)
+                raise
+            finally:
+                with _in_flight_lock:
+                    _in_flight.pop(key, None)
+        cached = future.result()
+
+    entities, content = cached
+    # Callers append to the entity list, so never hand out the cached object
+    return copy.deepcopy(entities), content
+
+
+def extraction_cache_stats():
+    with _in_flight_lock:
+        in_flight = len(_in_flight)
+    return {**_extraction_cache.stats(), "in_flight": in_flight, "deduplicated": _deduplicated}
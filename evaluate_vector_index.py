@@ -0,0 +1,71 @@
+# evaluate_vector_index.py
+#
+# Reports recall@k and query latency of the IVF index against exact brute force:
+#
+#     python vector_index.py build swiss_food_composition_database_small.csv
+#     python evaluate_vector_index.py swiss_food_composition_database_small.csv
+#
+# Queries are the stored embeddings of sampled foods, optionally plus free-text
+# queries (one per line) encoded with the matcher model.
+
+import argparse
+import time
+
+import numpy as np
+
+from swiss_food_matcher import get_model, index_base_path, load_embedding_index
+from vector_index import BruteForceIndex, IVFIndex
+
+
+def recall_at_k(exact_indices, approx_indices):
+    hits = [len(set(exact) & set(approx)) / len(exact) for exact, approx in zip(exact_indices, approx_indices)]
+    return float(np.mean(hits))
+
+
+def timed_search(index, queries, k):
+    start = time.perf_counter()
+    indices, _ = index.search(queries, k)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    return indices, elapsed_ms / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall@k of the IVF food index versus brute force.")
+    parser.add_argument("csv_path")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--samples", type=int, default=1000)
+    parser.add_argument("--nprobe", type=int, nargs="*", default=None)
+    parser.add_argument("--queries", help="Text file with one free-text query per line")
+    parser.add_argument("--noise", type=float, default=0.05, help="Gaussian noise added to sampled embeddings")
+    args = parser.parse_args()
+
+    _, _, embeddings, _ = load_embedding_index(args.csv_path)
+    base_path = index_base_path(args.csv_path)
+    if not IVFIndex.exists(base_path):
+        raise SystemExit(f"No IVF index at {base_path}. Build it with: python vector_index.py build {args.csv_path}")
+
+    # Perturbed copies of real rows, so a query is not trivially its own nearest neighbour
+    rng = np.random.default_rng(0)
+    sample = np.asarray(embeddings[rng.choice(len(embeddings), min(args.samples, len(embeddings)), replace=False)])
+    queries = sample + rng.normal(0, args.noise, sample.shape).astype(np.float32)
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            texts = [line.strip().lower() for line in f if line.strip()]
+        encoded = get_model().encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+        queries = np.vstack([queries, encoded.astype(np.float32)])
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    exact, brute_ms = timed_search(BruteForceIndex(embeddings), queries, args.k)
+    print(f"rows={len(embeddings)} queries={len(queries)} k={args.k}")
+    print(f"brute force: {brute_ms:.3f} ms/query")
+
+    ivf = IVFIndex.load(embeddings, base_path)
+    for nprobe in args.nprobe or [ivf.nprobe]:
+        ivf.nprobe = nprobe
+        approx, ivf_ms = timed_search(ivf, queries, args.k)
+        print(f"ivf nlist={len(ivf.centroids)} nprobe={nprobe}: {ivf_ms:.3f} ms/query, "
+              f"recall@{args.k}={recall_at_k(exact, approx):.4f}")
+
+
+if __name__ == "__main__":
+    main()
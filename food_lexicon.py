@@ -0,0 +1,217 @@
+# food_lexicon.py
+#
+# One food vocabulary for fallback detection, the rule-based extractor and the
+# matcher's short names: csv_foods.csv plus the speakable short form of every
+# Swiss DB name ("Banana, raw" -> "banana"). Terms are stored in a token trie,
+# so the longest multi-word mention ("peanut butter", "ice cream") is found in
+# one left-to-right scan. The trie is pickled under .food_index/ keyed by the
+# source files' contents, so the CSVs are parsed only when they change.
+
+import csv
+import glob
+import hashlib
+import os
+import pickle
+import re
+import threading
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CSV_FOODS_PATH = os.path.join(BASE_DIR, "csv_foods.csv")
+SWISS_DB_PATH = os.path.join(BASE_DIR, "swiss_food_composition_database_small.csv")
+LEXICON_DIR = os.path.join(BASE_DIR, ".food_index")
+LEXICON_FORMAT = 3
+# Spoken unit words and what they normalize to ("slices" -> "slice")
+UNITS = {
+    "g": "g", "gr": "g", "gram": "g", "grams": "g", "kg": "kg", "kilo": "kg", "kilos": "kg",
+    "ml": "ml", "milliliter": "ml", "milliliters": "ml", "millilitre": "ml", "millilitres": "ml",
+    "dl": "dl", "cl": "cl", "l": "l", "liter": "l", "liters": "l", "litre": "l", "litres": "l",
+    "oz": "oz", "ounce": "oz", "ounces": "oz",
+    "cup": "cup", "cups": "cup", "glass": "glass", "glasses": "glass", "mug": "mug", "mugs": "mug",
+    "bowl": "bowl", "bowls": "bowl", "plate": "plate", "plates": "plate",
+    "slice": "slice", "slices": "slice", "piece": "piece", "pieces": "piece",
+    "tablespoon": "tablespoon", "tablespoons": "tablespoon", "tbsp": "tablespoon",
+    "teaspoon": "teaspoon", "teaspoons": "teaspoon", "tsp": "teaspoon", "spoon": "spoon", "spoons": "spoon",
+    "can": "can", "cans": "can", "bottle": "bottle", "bottles": "bottle", "bar": "bar", "bars": "bar",
+    "handful": "handful", "handfuls": "handful", "scoop": "scoop", "scoops": "scoop",
+    "portion": "portion", "portions": "portion", "serving": "serving", "servings": "serving",
+}
+# csv_foods.csv has function, meal, unit and other words among its entries; they are never foods on their own
+NON_FOOD_WORDS = {
+    "a", "an", "and", "as", "at", "for", "from", "in", "i", "is", "it", "of", "on", "or",
+    "the", "to", "with", "some", "few", "several", "up", "thru", "x",
+    "breakfast", "brunch", "lunch", "dinner", "supper", "snack", "meal", "food", "dish", "side",
+    "green", "red", "fast", "date", "new", "made", "dry", "lean", "wild", "cool", "mix", "base", "step",
+    "pan", "pot", "jar", "tub", "pkg", "pkgs", "pkt", "lg", "min", "dose",
+    # Adjectives that are csv_foods entries on their own ("nothing special", "black coffee")
+    "special", "white", "black", "plain", "sweet", "cooked", "whole", "mixed", "frozen", "smoked",
+    "yellow", "brown", "creamy", "fat", "baby", "ground", "choice",
+} | set(UNITS)
+
+_WORD_RE = re.compile(r"[a-z]+(?:'[a-z]+)?")
+_END = ""  # trie key under which a node stores the term that ends there
+
+
+def _singular(word):
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith("oes"):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    return _WORD_RE.findall(text.lower())
+
+
+def short_names(name):
+    """'Bread (average)' -> ['bread'], 'Banana, raw' -> ['banana, raw', 'banana']."""
+    stripped = " ".join(re.sub(r"\(.*?\)", " ", name).lower().split()).strip(" ,")
+    return list(dict.fromkeys(alias for alias in (stripped, stripped.split(",")[0].strip()) if alias))
+
+
+def _read_csv_foods(path):
+    # Unquoted commas ("lemon, juice of"), so read line by line and keep the part before the first comma
+    with open(path, encoding="utf-8") as f:
+        next(f, None)
+        for line in f:
+            yield line.split(",")[0]
+
+
+def _read_swiss_names(path):
+    with open(path, encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            # Only the comma-free short form is something people say
+            yield short_names(row["name"])[-1] if row.get("name") else ""
+
+
+class FoodLexicon:
+    def __init__(self, terms):
+        self.terms = set()
+        self.trie = {}
+        for term in terms:
+            self.add(term)
+
+    def add(self, term):
+        words = tokenize(term)
+        if not words or (len(words) == 1 and words[0] in NON_FOOD_WORDS):
+            return
+        phrase = " ".join(words)
+        node = self.trie
+        for word in words:
+            node = node.setdefault(word, {})
+        node[_END] = phrase
+        self.terms.add(phrase)
+
+    def __contains__(self, phrase):
+        return " ".join(tokenize(phrase)) in self.terms
+
+    def __len__(self):
+        return len(self.terms)
+
+    def longest_at(self, words, start):
+        """Longest term starting at words[start] -> (term, word count) or (None, 0).
+        A plural last word also matches its singular ("bananas" -> "banana")."""
+        best, length = None, 0
+        node = self.trie
+        for i in range(start, len(words)):
+            word = words[i]
+            singular = _singular(word)
+            # The singular form ends a term here even when the plural does not
+            end = node.get(singular, {}).get(_END) if singular != word else None
+            node = node.get(word)
+            end = end or (node or {}).get(_END)
+            if end:
+                best, length = end, i - start + 1
+            if node is None:
+                break
+        return best, length
+
+    def find(self, text):
+        """All non-overlapping, leftmost-longest food mentions in text, in order."""
+        words = tokenize(text)
+        found = []
+        i = 0
+        while i < len(words):
+            term, length = self.longest_at(words, i)
+            if term:
+                found.append(term)
+                i += length
+            else:
+                i += 1
+        return found
+
+
+def _lexicon_key(paths):
+    digest = hashlib.sha256(str(LEXICON_FORMAT).encode("utf-8"))
+    for path in paths:
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def _stat(path):
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_mtime_ns, stat.st_size
+
+
+def build_food_lexicon(csv_foods_path=CSV_FOODS_PATH, swiss_db_path=SWISS_DB_PATH):
+    terms = list(_read_csv_foods(csv_foods_path))
+    if swiss_db_path and os.path.exists(swiss_db_path):
+        terms += _read_swiss_names(swiss_db_path)
+    return FoodLexicon(terms)
+
+
+_lexicons = {}
+_lexicon_lock = threading.Lock()
+
+
+def load_food_lexicon(csv_foods_path=CSV_FOODS_PATH, swiss_db_path=SWISS_DB_PATH, cache_dir=LEXICON_DIR):
+    """The lexicon for these sources, from memory, the pickled trie, or built from the CSVs."""
+    paths = [path for path in (csv_foods_path, swiss_db_path) if path and os.path.exists(path)]
+    # Called once per transcript, so unchanged files are recognized by stat alone; contents are hashed on a miss
+    stat_key = (LEXICON_FORMAT, cache_dir) + tuple(_stat(path) for path in paths)
+    lexicon = _lexicons.get(stat_key)
+    if lexicon is not None:
+        return lexicon
+
+    with _lexicon_lock:
+        lexicon = _lexicons.get(stat_key)
+        if lexicon is not None:
+            return lexicon
+
+        key = _lexicon_key(paths)
+        cache_path = os.path.join(cache_dir, f"lexicon.{key}.pkl")
+        if os.path.exists(cache_path):
+            with open(cache_path, "rb") as f:
+                lexicon = pickle.load(f)
+        else:
+            lexicon = build_food_lexicon(csv_foods_path, swiss_db_path)
+            os.makedirs(cache_dir, exist_ok=True)
+            for stale in glob.glob(os.path.join(cache_dir, "lexicon.*.pkl")):
+                os.remove(stale)
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(lexicon, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+            print(f"🧱 Built food lexicon with {len(lexicon)} terms: {cache_path}")
+        _lexicons[stat_key] = lexicon
+        return lexicon
+
+
+def find_potential_foods(transcript, extracted_entities, lexicon=None):
+    """Foods mentioned in the transcript that the extractor did not return."""
+    if lexicon is None:
+        lexicon = load_food_lexicon()
+    extracted = [" ".join(_singular(word) for word in tokenize(str(ent.get("extracted", ""))))
+                 for ent in extracted_entities]
+    missing = []
+    for term in lexicon.find(transcript):
+        key = " ".join(_singular(word) for word in term.split())
+        # Skip mentions already covered by (or covering) an extracted entity
+        if any(f" {key} " in f" {ent} " or f" {ent} " in f" {key} " for ent in extracted if ent):
+            continue
+        if term not in missing:
+            missing.append(term)
+    return missing
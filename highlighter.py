@@ -0,0 +1,78 @@
+# highlighter.py
+#
+# Colours foods, quantities/units and vague amounts in a transcript for st.markdown.
+# All terms go into one compiled alternation, so the text is scanned once and
+# highlights can never land inside the <span> markup of an earlier one.
+
+import functools
+import html
+import re
+
+from number_normalizer import VAGUE_QUANTITIES
+
+FOOD_COLOR = "#90ee90"
+QUANTITY_COLOR = "#40e0d0"
+VAGUE_COLOR = "#ffff99"
+VAGUE_TERMS = frozenset(VAGUE_QUANTITIES)
+
+
+def format_quantity(quantity):
+    """Text form of a quantity as it appears in the transcript: 2.0 -> "2"."""
+    if quantity is None:
+        return ""
+    if isinstance(quantity, float) and quantity.is_integer():
+        return str(int(quantity))
+    return str(quantity).strip()
+
+
+def _key(term):
+    return " ".join(term.lower().split())
+
+
+@functools.lru_cache(maxsize=256)
+def _compile(terms):
+    # Longest first, so "200 ml" wins over "200" and "apple juice" over "apple"
+    alternatives = sorted(terms, key=len, reverse=True)
+    pattern = "|".join(r"\s+".join(re.escape(word) for word in term.split()) for term in alternatives)
+    return re.compile(rf"(?<!\w)(?:{pattern})(?!\w)", re.IGNORECASE)
+
+
+def _term_colors(entities, vague_terms):
+    colors = {}
+
+    def add(term, color):
+        term = _key(term)
+        # Earlier (higher-priority) roles win when the same words play several
+        if term and term not in colors:
+            colors[term] = color
+
+    for ent in entities:
+        add(str(ent.get("extracted") or ""), FOOD_COLOR)
+    for ent in entities:
+        quantity = format_quantity(ent.get("quantity"))
+        unit = str(ent.get("unit") or "").strip()
+        if quantity.lower() in vague_terms:
+            add(quantity, VAGUE_COLOR)
+        elif quantity:
+            if unit:
+                add(f"{quantity} {unit}", QUANTITY_COLOR)
+                add(unit, QUANTITY_COLOR)
+            add(quantity, QUANTITY_COLOR)
+    return colors
+
+
+def highlight_transcript(text, entities, vague_terms=VAGUE_TERMS):
+    """HTML for an already number-normalized transcript with the entities' words coloured."""
+    colors = _term_colors(entities, vague_terms)
+    if not colors:
+        return html.escape(text, quote=False)
+
+    pieces = []
+    position = 0
+    for match in _compile(frozenset(colors)).finditer(text):
+        pieces.append(html.escape(text[position:match.start()], quote=False))
+        color = colors[_key(match.group())]
+        pieces.append(f'<span style="background-color:{color};">{html.escape(match.group(), quote=False)}</span>')
+        position = match.end()
+    pieces.append(html.escape(text[position:], quote=False))
+    return "".join(pieces)
@@ -0,0 +1,26 @@
+# json_utils.py
+#
+# JSON encoding for what the matcher and the apps put in meal records: numpy
+# scalars from the matcher, datetimes and sets. Shared by the apps, the log
+# sink, the meal store and the batch CLI.
+
+import json
+from datetime import datetime
+
+import numpy as np
+
+
+def make_json_serializable(obj):
+    """json.dumps default= hook."""
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    if isinstance(obj, set):
+        return list(obj)
+    return str(obj)
+
+
+def clean_list_for_json(data):
+    """A copy of data with only plain JSON types."""
+    return json.loads(json.dumps(data, default=make_json_serializable))
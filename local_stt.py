@@ -0,0 +1,48 @@
+# local_stt.py
+#
+# Offline CPU transcription with faster-whisper (CTranslate2 Whisper). It is an
+# optional dependency, not in requirements.txt: pip install faster-whisper
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from transcript_cache import cached_transcription
+
+LOCAL_STT_MODEL = os.getenv("LOCAL_STT_MODEL", "base.en")
+# int8 is the fast choice on CPU; float32 is the accuracy reference
+LOCAL_STT_COMPUTE_TYPE = os.getenv("LOCAL_STT_COMPUTE_TYPE", "int8")
+LOCAL_STT_THREADS = int(os.getenv("LOCAL_STT_THREADS", str(os.cpu_count() or 4)))
+# Number of files one model can transcribe at the same time
+LOCAL_STT_WORKERS = int(os.getenv("LOCAL_STT_WORKERS", "1"))
+
+_models = {}
+_model_lock = threading.Lock()
+
+
+def get_local_model(model_size=LOCAL_STT_MODEL, compute_type=LOCAL_STT_COMPUTE_TYPE,
+                    cpu_threads=LOCAL_STT_THREADS, num_workers=LOCAL_STT_WORKERS):
+    key = (model_size, compute_type, cpu_threads, num_workers)
+    with _model_lock:
+        model = _models.get(key)
+        if model is None:
+            try:
+                from faster_whisper import WhisperModel
+            except ImportError as e:
+                raise ImportError("Local transcription needs faster-whisper: pip install faster-whisper") from e
+            model = WhisperModel(model_size, device="cpu", compute_type=compute_type,
+                                 cpu_threads=cpu_threads, num_workers=num_workers)
+            _models[key] = model
+        return model
+
+
+@cached_transcription(f"local:{LOCAL_STT_MODEL}:{LOCAL_STT_COMPUTE_TYPE}")
+def transcribe_locally(file_path: str) -> str:
+    segments, _ = get_local_model().transcribe(file_path, beam_size=1, vad_filter=True)
+    return " ".join(segment.text.strip() for segment in segments)
+
+
+def transcribe_batch(file_paths):
+    """Transcribe queued files on the shared model, LOCAL_STT_WORKERS at a time; results keep input order."""
+    with ThreadPoolExecutor(max_workers=LOCAL_STT_WORKERS) as executor:
+        return list(executor.map(transcribe_locally, file_paths))
@@ -0,0 +1,263 @@
+# log_sink.py
+#
+# Background delivery of meal logs to the Google Sheets Apps Script endpoint.
+#
+# log() only enqueues, so the UI never waits on the network. A daemon thread
+# drains the queue in batches (by size or interval) over one keep-alive
+# requests.Session. The Apps Script takes one record per POST, so a batch is
+# several POSTs on the same connection. Failed posts are retried with backoff;
+# records that still fail, or arrive while the endpoint is down, are appended
+# to a local JSONL spill file and replayed once it answers again.
+
+import atexit
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+from json_utils import make_json_serializable
+from lru_cache import LRUCache
+
+LOG_SPILL_DIR = os.getenv(
+    "LOG_SPILL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".log_spill")
+)
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "20"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "2.0"))
+LOG_TIMEOUT = float(os.getenv("LOG_TIMEOUT", "10"))
+LOG_MAX_RETRIES = int(os.getenv("LOG_MAX_RETRIES", "4"))
+# After a batch gives up, skip the network for this long and spill directly
+LOG_COOLDOWN = float(os.getenv("LOG_COOLDOWN", "30"))
+
+
+def make_meal_id(user_id, content, when=None):
+    """Stable meal_id for one input (audio bytes or text) so reruns log the same meal."""
+    if isinstance(content, str):
+        content = content.strip().lower().encode("utf-8")
+    digest = hashlib.sha256(user_id.encode("utf-8") + b"\0" + content).hexdigest()[:12]
+    return f"meal_{(when or datetime.now()).strftime('%Y%m%d')}_{digest}"
+
+
+class _PermanentError(Exception):
+    """The endpoint rejected the record itself; retrying or spilling will not help."""
+
+
+class LogSink:
+    def __init__(self, url, batch_size=LOG_BATCH_SIZE, flush_interval=LOG_FLUSH_INTERVAL, max_queue=1000,
+                 timeout=LOG_TIMEOUT, max_retries=LOG_MAX_RETRIES, backoff=0.5, cooldown=LOG_COOLDOWN,
+                 spill_path=None):
+        self.url = url
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.cooldown = cooldown
+        self.spill_path = spill_path or os.path.join(
+            LOG_SPILL_DIR, hashlib.sha1(url.encode("utf-8")).hexdigest()[:12] + ".jsonl"
+        )
+        self.session = requests.Session()
+        self._queue = queue.Queue(maxsize=max_queue)
+        # meal_id -> digest of the last version delivered; identical reruns are dropped
+        self._delivered = LRUCache(max_size=4096)
+        self._spill_lock = threading.Lock()
+        self._down_until = 0.0
+        self._stopping = threading.Event()
+        self._idle = threading.Condition()
+        self._busy = 0
+        self.sent = 0
+        self.failed_attempts = 0
+        self.spilled = 0
+        self.rejected = 0
+        self.replayed = 0
+        self.duplicates = 0
+        self._thread = threading.Thread(target=self._run, name="log-sink", daemon=True)
+        self._thread.start()
+
+    # --- Producer side (UI thread) ---
+    def log(self, record):
+        """Queue one record (a dict with a meal_id); never blocks on the network."""
+        if not record.get("meal_id"):
+            raise ValueError("meal log records need a meal_id")
+        payload = json.loads(json.dumps(record, default=make_json_serializable))
+        with self._idle:
+            self._busy += 1
+        try:
+            self._queue.put_nowait(payload)
+        except queue.Full:
+            self._spill([payload])
+            self._done(1)
+
+    def flush(self, timeout=None):
+        """Wait until everything queued so far was sent or spilled. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while self._busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def close(self, timeout=5.0):
+        self.flush(timeout)
+        self._stopping.set()
+        self._thread.join(timeout)
+        self.session.close()
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "sent": self.sent,
+            "duplicates": self.duplicates,
+            "failed_attempts": self.failed_attempts,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "rejected": self.rejected,
+            "endpoint_down": time.monotonic() < self._down_until,
+        }
+
+    # --- Consumer side (background thread) ---
+    def _done(self, count):
+        with self._idle:
+            self._busy -= count
+            self._idle.notify_all()
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        self._replay_spill()
+        while not self._stopping.is_set():
+            batch = self._next_batch()
+            if batch:
+                try:
+                    if self._deliver(batch):
+                        self._replay_spill()
+                except Exception as e:
+                    print(f"❌ Log sink error: {e!r}")
+                finally:
+                    self._done(len(batch))
+            else:
+                self._replay_spill()
+
+    def _deliver(self, batch):
+        """Post a batch; returns False if the endpoint was unreachable and records were spilled."""
+        # Reruns enqueue the same meal repeatedly; keep the latest version of each meal_id
+        latest = {}
+        for payload in batch:
+            latest[payload["meal_id"]] = payload
+        self.duplicates += len(batch) - len(latest)
+
+        pending = []
+        for meal_id, payload in latest.items():
+            digest = hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+            if self._delivered.get(meal_id) == digest:
+                self.duplicates += 1
+            else:
+                pending.append((meal_id, digest, payload))
+
+        if time.monotonic() < self._down_until:
+            self._spill([payload for _, _, payload in pending])
+            return False
+        for position, (meal_id, digest, payload) in enumerate(pending):
+            try:
+                self._post_with_retry(payload)
+            except _PermanentError as e:
+                self.rejected += 1
+                print(f"❌ Log rejected for {meal_id}: {e}")
+                continue
+            except requests.RequestException:
+                self._down_until = time.monotonic() + self.cooldown
+                self._spill([payload for _, _, payload in pending[position:]])
+                return False
+            self._delivered.put(meal_id, digest)
+            self.sent += 1
+        return True
+
+    def _post_with_retry(self, payload):
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.post(self.url, json=payload, timeout=self.timeout)
+                if 400 <= response.status_code < 500 and response.status_code not in (408, 429):
+                    raise _PermanentError(f"HTTP {response.status_code}")
+                response.raise_for_status()
+                return response
+            except requests.RequestException:
+                self.failed_attempts += 1
+                if attempt == self.max_retries or self._stopping.is_set():
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+
+    # --- Durable spill ---
+    def _spill(self, payloads):
+        if not payloads:
+            return
+        with self._spill_lock:
+            os.makedirs(os.path.dirname(self.spill_path), exist_ok=True)
+            with open(self.spill_path, "a", encoding="utf-8") as f:
+                for payload in payloads:
+                    f.write(json.dumps(payload) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        self.spilled += len(payloads)
+        print(f"💾 Spilled {len(payloads)} meal log(s) to {self.spill_path}")
+
+    def _replay_spill(self):
+        if time.monotonic() < self._down_until or not os.path.exists(self.spill_path):
+            return
+        replay_path = self.spill_path + ".replay"
+        with self._spill_lock:
+            # A replay file left by a crash is picked up before newer spills
+            if not os.path.exists(replay_path):
+                os.replace(self.spill_path, replay_path)
+        with open(replay_path, encoding="utf-8") as f:
+            payloads = []
+            for line in f:
+                try:
+                    payloads.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue  # a line cut off mid-write
+        os.remove(replay_path)
+        if payloads:
+            print(f"🔁 Replaying {len(payloads)} spilled meal log(s)")
+            self.replayed += len(payloads)
+            for start in range(0, len(payloads), self.batch_size):
+                self._deliver(payloads[start:start + self.batch_size])
+
+
+_sinks = {}
+_sinks_lock = threading.Lock()
+
+
+def get_log_sink(url):
+    """One sink (thread + session) per endpoint URL, shared across reruns."""
+    with _sinks_lock:
+        sink = _sinks.get(url)
+        if sink is None:
+            sink = LogSink(url)
+            _sinks[url] = sink
+        return sink
+
+
+@atexit.register
+def _close_sinks():
+    for sink in list(_sinks.values()):
+        sink.close(timeout=LOG_TIMEOUT)
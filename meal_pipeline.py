@@ -0,0 +1,189 @@
+# meal_pipeline.py
+#
+# The meal-logging flow as an asyncio pipeline decoupled from Streamlit:
+#
+#     ingest -> transcribe -> extract -> match -> log
+#
+# Each stage is a pool of workers reading from a bounded queue, so several
+# meals are in flight at once and a slow stage applies back-pressure instead
+# of piling up work. The blocking calls run in worker threads.
+#
+#     python meal_pipeline.py mp3_example_files/*.mp3
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+from audio_ingest import audio_tempfile, ingest_audio
+from entity_extractor import extract_food_entities
+from stt_engines import transcribe
+
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "swiss_food_composition_database_small.csv")
+STAGES = ("ingest", "transcribe", "extract", "match", "log")
+DEFAULT_WORKERS = {"ingest": 2, "transcribe": 4, "extract": 4, "match": 1, "log": 1}
+
+
+def new_meal(audio_path=None, audio_bytes=None, filename=None, transcript=None, meal_id=None, user_id="anon_user"):
+    """A pipeline job. Give audio (a path, or bytes plus filename) or a ready transcript."""
+    return {
+        "meal_id": meal_id or f"meal_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}",
+        "user_id": user_id,
+        "audio_path": audio_path,
+        "audio_bytes": audio_bytes,
+        "filename": filename or (os.path.basename(audio_path) if audio_path else None),
+        "wav": None,
+        "transcript": transcript,
+        "entities": None,
+        "raw_extraction": None,
+        "matches": None,
+        "candidates": None,
+        "timings": {},
+        "error": None,
+    }
+
+
+class MealLogPipeline:
+    def __init__(self, stages=STAGES, workers=None, queue_size=8, db_path=DB_PATH, threshold=0.7, log=None):
+        self.stages = [stage for stage in STAGES if stage in stages]
+        self.workers = {**DEFAULT_WORKERS, **(workers or {})}
+        self.queue_size = queue_size
+        self.db_path = db_path
+        self.threshold = threshold
+        self.log = log
+        self.stage_seconds = {stage: [] for stage in self.stages}
+        self._food_db = None
+        self._queues = []
+        self._tasks = []
+
+    # --- Stages (blocking; run in threads) ---
+    def _ingest(self, meal):
+        if meal["transcript"] is not None or meal["wav"] is not None:
+            return
+        if meal["audio_bytes"] is None:
+            with open(meal["audio_path"], "rb") as f:
+                meal["audio_bytes"] = f.read()
+        meal["wav"] = ingest_audio(meal["audio_bytes"], meal["filename"]).wav
+
+    def _transcribe(self, meal):
+        if meal["transcript"] is not None:
+            return
+        try:
+            with audio_tempfile(meal["wav"]) as wav_path:
+                meal["transcript"] = transcribe(wav_path)
+        finally:
+            # Finished meals stay referenced until the whole batch is done; do not keep their audio
+            meal["audio_bytes"] = meal["wav"] = None
+
+    def _extract(self, meal):
+        if meal["entities"] is None:
+            meal["entities"], meal["raw_extraction"] = extract_food_entities(meal["transcript"])
+            # A failed LLM call comes back as ([], "Error: ..."), not as an exception
+            if meal["raw_extraction"].startswith("Error:"):
+                raise RuntimeError(meal["raw_extraction"])
+
+    def _match(self, meal):
+        from swiss_food_matcher import load_food_database, match_entities
+
+        if self._food_db is None:
+            self._food_db = load_food_database(self.db_path)
+        # Batch output keeps the candidates for review, so rank lexical hits too
+        meal["matches"], meal["candidates"] = match_entities(meal["entities"], self._food_db, self.threshold,
+                                                             fill_candidates=True)
+
+    def _log(self, meal):
+        if self.log is not None:
+            self.log(meal)
+
+    # --- Plumbing ---
+    async def _worker(self, index):
+        stage = self.stages[index]
+        run_stage = getattr(self, f"_{stage}")
+        queue = self._queues[index]
+        while True:
+            meal, done = await queue.get()
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(run_stage, meal)
+            except Exception as e:
+                meal["error"] = f"{stage}: {e!r}"
+            elapsed = time.perf_counter() - started
+            meal["timings"][stage] = round(elapsed, 4)
+            self.stage_seconds[stage].append(elapsed)
+
+            if meal["error"] is not None or index == len(self.stages) - 1:
+                if not done.done():
+                    done.set_result(meal)
+            else:
+                await self._queues[index + 1].put((meal, done))
+            queue.task_done()
+
+    async def start(self):
+        self._queues = [asyncio.Queue(maxsize=self.queue_size) for _ in self.stages]
+        self._tasks = [
+            asyncio.create_task(self._worker(index))
+            for index, stage in enumerate(self.stages)
+            for _ in range(self.workers.get(stage, 1))
+        ]
+
+    async def submit(self, meal):
+        """Queue a meal; returns a future resolved with the finished meal dict."""
+        done = asyncio.get_running_loop().create_future()
+        await self._queues[0].put((meal, done))
+        return done
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def run(self, meals):
+        await self.start()
+        try:
+            futures = [await self.submit(meal) for meal in meals]
+            return await asyncio.gather(*futures)
+        finally:
+            await self.close()
+
+    def stats(self):
+        return {
+            stage: {
+                "count": len(seconds),
+                "total_s": round(sum(seconds), 3),
+                "mean_s": round(sum(seconds) / len(seconds), 4) if seconds else 0.0,
+            }
+            for stage, seconds in self.stage_seconds.items()
+        }
+
+
+def run_meal_pipeline(meals, **pipeline_kwargs):
+    """Synchronous entry point for scripts and Streamlit: run meals through a fresh pipeline."""
+    return asyncio.run(MealLogPipeline(**pipeline_kwargs).run(meals))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the meal-logging pipeline without the UI.")
+    parser.add_argument("audio_files", nargs="*")
+    parser.add_argument("--transcript", action="append", default=[], help="Meal description text (repeatable)")
+    parser.add_argument("--user-id", default="anon_user")
+    args = parser.parse_args()
+
+    meals = [new_meal(audio_path=path, user_id=args.user_id) for path in args.audio_files]
+    meals += [new_meal(transcript=text, user_id=args.user_id) for text in args.transcript]
+    if not meals:
+        parser.error("give audio files or --transcript")
+
+    pipeline = MealLogPipeline(stages=("ingest", "transcribe", "extract", "match"))
+    results = asyncio.run(pipeline.run(meals))
+    for meal in results:
+        record = {key: meal[key] for key in ("meal_id", "filename", "transcript", "entities", "matches", "timings", "error")}
+        print(json.dumps(record, default=str))
+    print(json.dumps({"stage_stats": pipeline.stats()}), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# meal_state.py
+#
+# Per-meal clarification state that survives Streamlit reruns. Each entity moves
+#
+#     extracted -> clarified -> matched -> logged
+#
+# and only steps back when its own inputs change: a new quantity or unit patches
+# the existing match, a correction re-matches just that entity, and a meal is
+# logged again only if something changed since the last log. A widget click
+# therefore costs work for the edited entity, not for the whole meal.
+
+from number_normalizer import VAGUE_QUANTITIES, parse_quantity
+from swiss_food_matcher import match_entities
+
+STATUSES = ("extracted", "clarified", "matched", "logged")
+
+
+class EntityState:
+    def __init__(self, key, entity, source="extractor"):
+        self.key = key
+        self.source = source
+        self.extracted = str(entity.get("extracted", "")).strip()
+        raw_quantity = entity.get("quantity")
+        self.vague = isinstance(raw_quantity, str) and raw_quantity.strip().lower() in VAGUE_QUANTITIES
+        # What the extractor gave; "a", "one", "two hundred", "1,5" become numbers
+        self.given_quantity = parse_quantity(raw_quantity)
+        self.given_unit = str(entity.get("unit") or "").strip() or None
+        self.needs_quantity = self.given_quantity is None
+        # What the user confirmed; set by clarify()
+        self.quantity = self.given_quantity
+        self.unit = self.given_unit
+        self.correction = None
+        self.match = None
+        # Whether the extracted name itself was recognized (decides if a correction box is shown)
+        self.recognized = None
+        self.prompt = None
+        self.status = "extracted"
+
+    @property
+    def query(self):
+        return self.correction or self.extracted
+
+    def clarify(self, quantity, unit):
+        """Record the quantity/unit for this run; returns True if they changed."""
+        if self.needs_quantity:
+            self.prompt = {"extracted": self.extracted, "asked_for": "quantity", "response": quantity}
+        if self.status != "extracted" and (quantity, unit) == (self.quantity, self.unit):
+            return False
+        self.quantity, self.unit = quantity, unit
+        if self.match is not None:
+            # Same food, new amount: patch the match instead of matching again
+            self.match = {**self.match, "quantity": quantity, "unit": unit}
+            self.status = "matched"
+        else:
+            self.status = "clarified"
+        return True
+
+    def correct(self, text):
+        """Use text instead of the extracted name for matching; returns True if that changed."""
+        text = (text or "").strip() or None
+        if text == self.correction:
+            return False
+        self.correction = text
+        self.match = None
+        if self.status != "extracted":
+            self.status = "clarified"
+        return True
+
+    def clarified_entity(self):
+        return {"extracted": self.extracted, "quantity": self.quantity, "unit": self.unit}
+
+
+class MealState:
+    def __init__(self, meal_id, transcript, entities):
+        self.meal_id = meal_id
+        self.transcript = transcript
+        self.entities = {}
+        self.match_calls = 0
+        self.matched_count = 0
+        self._logged_keys = None
+        for entity in entities:
+            self._add(entity, "extractor")
+
+    def _add(self, entity, source):
+        base = str(entity.get("extracted", "")).strip()
+        key, n = base, 1
+        # Two mentions of the same food get their own widgets
+        while key in self.entities:
+            n += 1
+            key = f"{base}#{n}"
+        self.entities[key] = EntityState(key, entity, source)
+        return self.entities[key]
+
+    def include(self, food, included):
+        """Add or drop a fallback-detected food (the "include ... ?" checkboxes)."""
+        key = f"fallback:{food}"
+        if included and key not in self.entities:
+            self.entities[key] = EntityState(key, {"extracted": food, "quantity": None, "unit": None}, "fallback")
+        elif not included:
+            self.entities.pop(key, None)
+
+    def active(self):
+        return list(self.entities.values())
+
+    def match_pending(self, food_db, threshold=0.7):
+        """Match only the clarified entities whose query has no match yet; returns how many."""
+        pending = [entity for entity in self.entities.values() if entity.status == "clarified"]
+        if not pending:
+            return 0
+        queries = [{"extracted": entity.query, "quantity": entity.quantity, "unit": entity.unit} for entity in pending]
+        matches, _ = match_entities(queries, food_db, threshold)
+        for entity, match in zip(pending, matches):
+            entity.match = match
+            entity.status = "matched"
+            if entity.correction is None:
+                entity.recognized = bool(match["recognized"]) and match["ID"] is not None and match["score"] >= threshold
+        self.match_calls += 1
+        self.matched_count += len(pending)
+        return len(pending)
+
+    def clarified_entities(self):
+        return [entity.clarified_entity() for entity in self.entities.values() if entity.status != "extracted"]
+
+    def matched_entities(self):
+        return [entity.match for entity in self.entities.values() if entity.match is not None]
+
+    def prompts(self):
+        return [entity.prompt for entity in self.entities.values() if entity.prompt is not None]
+
+    def needs_logging(self):
+        """True once everything is matched and something changed since the last log."""
+        entities = self.entities.values()
+        if not entities or any(entity.match is None for entity in entities):
+            return False
+        return self._logged_keys != list(self.entities) or any(entity.status != "logged" for entity in entities)
+
+    def mark_logged(self):
+        for entity in self.entities.values():
+            entity.status = "logged"
+        self._logged_keys = list(self.entities)
@@ -0,0 +1,203 @@
+# meal_store.py
+#
+# Local SQLite copy of every meal log the apps send to Google Sheets, so history
+# can be queried quickly and offline:
+#
+#     store = get_meal_store()
+#     store.put_many(records)
+#     for meal in store.scan(user_id="anon_user", start="2024-05-01", end="2024-06-01"):
+#         ...
+#     python meal_store.py export --user anon_user --since 2024-05-01 --format csv > may.csv
+#
+# One row per meal_id; entities, matches and prompts are stored as JSON text.
+# (user_id, logged_at) and logged_at are indexed, and scans stream from their
+# own read connection, so tables with millions of rows are fine on one node.
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+
+import pandas as pd
+
+from json_utils import make_json_serializable
+
+MEAL_STORE_PATH = os.getenv(
+    "MEAL_STORE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "meals.db")
+)
+JSON_FIELDS = ("entities", "matches", "prompts")
+INSERT_CHUNK = 10000
+SCAN_CHUNK = 1000
+
+
+def _timestamp(value):
+    # Stored as ISO text so string order is time order
+    if value is None:
+        value = datetime.now()
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.isoformat(timespec="seconds")
+
+
+class MealStore:
+    def __init__(self, path=MEAL_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS meals ("
+            "meal_id TEXT NOT NULL UNIQUE, user_id TEXT NOT NULL, logged_at TEXT NOT NULL, "
+            "raw_text TEXT, entities TEXT, matches TEXT, prompts TEXT);"
+            "CREATE INDEX IF NOT EXISTS meals_user_time ON meals (user_id, logged_at);"
+            "CREATE INDEX IF NOT EXISTS meals_time ON meals (logged_at);"
+        )
+        self._conn.commit()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        # WAL lets scans run while the app keeps writing
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @staticmethod
+    def _row(record):
+        return (
+            record["meal_id"],
+            record.get("user_id") or "anon_user",
+            _timestamp(record.get("logged_at")),
+            record.get("raw_text"),
+            *(json.dumps(record.get(field) or [], default=make_json_serializable) for field in JSON_FIELDS),
+        )
+
+    def put(self, record):
+        self.put_many([record])
+
+    def put_many(self, records):
+        """Insert or update meals by meal_id in one transaction; the first logged_at is kept."""
+        rows = [self._row(record) for record in records]
+        with self._lock:
+            with self._conn:
+                for start in range(0, len(rows), INSERT_CHUNK):
+                    self._conn.executemany(
+                        "INSERT INTO meals (meal_id, user_id, logged_at, raw_text, entities, matches, prompts) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                        "ON CONFLICT (meal_id) DO UPDATE SET user_id = excluded.user_id, "
+                        "raw_text = excluded.raw_text, entities = excluded.entities, "
+                        "matches = excluded.matches, prompts = excluded.prompts",
+                        rows[start:start + INSERT_CHUNK],
+                    )
+        return len(rows)
+
+    @staticmethod
+    def _meal(row):
+        meal = dict(zip(("meal_id", "user_id", "logged_at", "raw_text") + JSON_FIELDS, row))
+        for field in JSON_FIELDS:
+            meal[field] = json.loads(meal[field]) if meal[field] else []
+        return meal
+
+    def get(self, meal_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT meal_id, user_id, logged_at, raw_text, entities, matches, prompts "
+                "FROM meals WHERE meal_id = ?", (meal_id,)
+            ).fetchone()
+        return self._meal(row) if row else None
+
+    @staticmethod
+    def _where(user_id, start, end):
+        clauses, params = [], []
+        if user_id is not None:
+            clauses.append("user_id = ?")
+            params.append(user_id)
+        if start is not None:
+            clauses.append("logged_at >= ?")
+            params.append(_timestamp(start))
+        if end is not None:
+            clauses.append("logged_at < ?")
+            params.append(_timestamp(end))
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def scan(self, user_id=None, start=None, end=None, limit=None, newest_first=False):
+        """Yield meals in time order for [start, end), optionally for one user."""
+        where, params = self._where(user_id, start, end)
+        sql = ("SELECT meal_id, user_id, logged_at, raw_text, entities, matches, prompts FROM meals"
+               + where + " ORDER BY logged_at" + (" DESC" if newest_first else ""))
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        # A private connection so a long scan neither holds the write lock nor loads every row
+        conn = self._connect()
+        try:
+            cursor = conn.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(SCAN_CHUNK)
+                if not rows:
+                    break
+                for row in rows:
+                    yield self._meal(row)
+        finally:
+            conn.close()
+
+    def count(self, user_id=None, start=None, end=None):
+        where, params = self._where(user_id, start, end)
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM meals" + where, params).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# --- Export (same shape as the apps' download buttons) ---
+def match_rows(meals):
+    """One row per matched entity, tagged with its meal."""
+    for meal in meals:
+        for match in meal["matches"]:
+            yield {"meal_id": meal["meal_id"], "user_id": meal["user_id"], "logged_at": meal["logged_at"], **match}
+
+
+def export_json(meals):
+    return json.dumps(list(match_rows(meals)), indent=2, default=make_json_serializable)
+
+
+def export_csv(meals):
+    # The apps' "Download CSV" columns, prefixed with the meal they belong to
+    return pd.DataFrame(list(match_rows(meals))).to_csv(index=False)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_meal_store(path=MEAL_STORE_PATH):
+    global _store
+    with _store_lock:
+        if _store is None or _store.path != path:
+            _store = MealStore(path)
+        return _store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query or export the local meal-log store.")
+    parser.add_argument("command", choices=["count", "export"])
+    parser.add_argument("--db", default=MEAL_STORE_PATH)
+    parser.add_argument("--user", default=None)
+    parser.add_argument("--since", default=None, help="ISO date/time, inclusive")
+    parser.add_argument("--until", default=None, help="ISO date/time, exclusive")
+    parser.add_argument("--format", choices=["json", "csv"], default="json")
+    args = parser.parse_args()
+
+    store = MealStore(args.db)
+    if args.command == "count":
+        print(store.count(args.user, args.since, args.until))
+        return
+    meals = store.scan(args.user, args.since, args.until)
+    sys.stdout.write(export_csv(meals) if args.format == "csv" else export_json(meals))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+# number_normalizer.py
+#
+# Rewrites spelled-out numbers as digits: "two hundred and fifty grams" -> "250 grams",
+# "one and a half cups" -> "1.5 cups", "three quarters of a pizza" -> "0.75 of a pizza".
+# Words are checked against a fixed number-word set, and a run of number words is
+# parsed as one span in a single left-to-right pass.
+
+import functools
+import re
+
+UNITS = {
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+    "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13, "fourteen": 14,
+    "fifteen": 15, "sixteen": 16, "seventeen": 17, "eighteen": 18, "nineteen": 19,
+}
+TENS = {
+    "twenty": 20, "thirty": 30, "forty": 40, "fifty": 50,
+    "sixty": 60, "seventy": 70, "eighty": 80, "ninety": 90,
+}
+SCALES = {"hundred": 100, "thousand": 1000, "million": 1000000}
+FRACTIONS = {"half": 0.5, "quarter": 0.25, "quarters": 0.25}
+VAGUE_QUANTITIES = {"some", "few", "several"}
+NUMBER_WORDS = set(UNITS) | set(TENS) | set(SCALES)
+# Words that can start a number or a fraction ("three quarters", "half a")
+_TRIGGER_WORDS = NUMBER_WORDS | set(FRACTIONS)
+_AFTER_ARTICLE = set(SCALES) | set(FRACTIONS)
+
+# Words, or single non-space characters, so punctuation stays where it was
+_TOKEN_RE = re.compile(r"[A-Za-z]+(?:-[A-Za-z]+)*|\S")
+_NUMERIC_RE = re.compile(r"^\d+(?:[.,]\d+)?$")
+# Texts without any number word (the common case for the rest of a transcript) are returned as is
+_WORD_RE = re.compile(r"[a-z]+")
+
+
+def _format(value):
+    return str(int(value)) if float(value).is_integer() else str(value)
+
+
+def _is_number_word(word):
+    if word in NUMBER_WORDS:
+        return True
+    return "-" in word and all(part in NUMBER_WORDS for part in word.split("-"))
+
+
+def _continues(current, word):
+    # Whether word can extend a number whose running value (below the last thousand/million) is current
+    part = word.split("-")[0]
+    if part in UNITS:
+        return current % 100 == 0 or (current % 100 in TENS.values() and UNITS[part] < 10)
+    if part in TENS:
+        return current % 100 == 0
+    if part == "hundred":
+        return current < 100
+    return True
+
+
+def _fraction_at(words, i):
+    # "a half", "half a", "half", "a quarter", "three quarters" -> (value, words consumed)
+    if i < len(words) and words[i] in ("a", "an") and i + 1 < len(words) and words[i + 1] in FRACTIONS:
+        return FRACTIONS[words[i + 1]], 2
+    if i + 1 < len(words) and words[i] == "half" and words[i + 1] in ("a", "an"):
+        return FRACTIONS["half"], 2
+    if i < len(words) and words[i] in FRACTIONS:
+        return FRACTIONS[words[i]], 1
+    if i + 1 < len(words) and words[i] in UNITS and words[i + 1] in FRACTIONS:
+        return UNITS[words[i]] * FRACTIONS[words[i + 1]], 2
+    return None, 0
+
+
+def parse_number_span(words, start=0):
+    """Parse the number starting at words[start] (lowercase); returns (value, words consumed) or (None, 0)."""
+    total, current, i = 0, 0, start
+    seen_number = False
+    last_scale = False
+    # "a hundred", "a thousand"
+    if i + 1 < len(words) and words[i] in ("a", "an") and words[i + 1] in SCALES:
+        current, i, seen_number = 1, i + 1, True
+
+    while i < len(words):
+        word = words[i]
+        if _is_number_word(word) and (not seen_number or _continues(current, word)):
+            for part in word.split("-"):
+                if part in UNITS:
+                    current += UNITS[part]
+                elif part in TENS:
+                    current += TENS[part]
+                elif part == "hundred":
+                    current = (current or 1) * 100
+                else:
+                    total += (current or 1) * SCALES[part]
+                    current = 0
+            seen_number = True
+            last_scale = word in SCALES
+            i += 1
+        elif word == "and" and seen_number and i + 1 < len(words):
+            fraction, used = _fraction_at(words, i + 1)
+            if fraction is not None:
+                return total + current + fraction, i + 1 + used - start
+            # "two hundred and fifty", but not "two and three"
+            if last_scale and words[i + 1] in NUMBER_WORDS and words[i + 1] not in SCALES:
+                i += 1
+                last_scale = False
+                continue
+            break
+        elif word == "point" and seen_number and i + 1 < len(words) and UNITS.get(words[i + 1], 10) < 10:
+            digits = []
+            i += 1
+            while i < len(words) and words[i] in UNITS and UNITS[words[i]] < 10:
+                digits.append(str(UNITS[words[i]]))
+                i += 1
+            return float(f"{total + current}.{''.join(digits)}"), i - start
+        else:
+            break
+    if not seen_number:
+        return None, 0
+    return total + current, i - start
+
+
+@functools.lru_cache(maxsize=4096)
+def normalize_numbers(text):
+    """Replace spelled-out numbers and fractions with digits; everything else is left untouched."""
+    lowered = text.lower()
+    if _TRIGGER_WORDS.isdisjoint(_WORD_RE.findall(lowered)):
+        return text
+    tokens = list(_TOKEN_RE.finditer(lowered))
+    words = [token.group() for token in tokens]
+    pieces = []
+    position = 0
+    i = 0
+    while i < len(tokens):
+        word = words[i]
+        # Most words are not numbers; a set lookup rules them out
+        if (_is_number_word(word) or word in FRACTIONS
+                or (word in ("a", "an") and i + 1 < len(words) and words[i + 1] in _AFTER_ARTICLE)):
+            # "three quarters" is a fraction, not 3 followed by a word
+            value, used = _fraction_at(words, i)
+            if value is None:
+                value, used = parse_number_span(words, i)
+            if used:
+                pieces.append(text[position:tokens[i].start()])
+                pieces.append(_format(value))
+                position = tokens[i + used - 1].end()
+                i += used
+                continue
+        i += 1
+    pieces.append(text[position:])
+    return "".join(pieces)
+
+
+@functools.lru_cache(maxsize=1024)
+def _parse_quantity_text(text):
+    text = text.strip().lower()
+    if _NUMERIC_RE.match(text):
+        value = float(text.replace(",", "."))
+        return int(value) if value.is_integer() else value
+    words = _TOKEN_RE.findall(text)
+    if words in (["a"], ["an"]):
+        return 1
+    fraction, used = _fraction_at(words, 0)
+    if fraction is not None and used == len(words):
+        return fraction
+    value, used = parse_number_span(words)
+    if used and used == len(words):
+        return value
+    return None
+
+
+def parse_quantity(quantity):
+    """A numeric quantity from a number or text ("2", "1,5", "a", "two hundred", "half");
+    None when it is missing, vague ("some") or not a number."""
+    if quantity is None or isinstance(quantity, bool):
+        return None
+    if isinstance(quantity, (int, float)):
+        return quantity
+    return _parse_quantity_text(str(quantity))
@@ -1,14 +1,128 @@
+import io
 import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 from openai import OpenAI
 from dotenv import load_dotenv
+from pydub import AudioSegment
+from pydub.silence import detect_nonsilent
+
+from transcript_cache import cached_transcription
 
 load_dotenv()
+# OPENAI_BASE_URL (read by the SDK) points this at a local stub server for testing
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
+WHISPER_MODEL = "whisper-1"
+# Whisper rejects uploads above 25 MB; larger files are transcribed in chunks
+MAX_UPLOAD_BYTES = 25 * 1024 * 1024
+CHUNK_WORKERS = int(os.getenv("STT_CHUNK_WORKERS", "4"))
+
+
+@cached_transcription(f"openai:{WHISPER_MODEL}")
 def transcribe_with_openai(file_path: str) -> str:
+    if os.path.getsize(file_path) > MAX_UPLOAD_BYTES:
+        return transcribe_chunked(file_path)["text"]
     with open(file_path, "rb") as audio_file:
         transcript = client.audio.transcriptions.create(
-            model="whisper-1",
+            model=WHISPER_MODEL,
             file=audio_file
         )
         return transcript.text
+
+
+def split_audio(audio, max_chunk_ms=5 * 60 * 1000, min_silence_ms=500, silence_offset_db=16, overlap_ms=2000):
+    """Split on silence into chunks of at most max_chunk_ms.
+
+    Returns (start_ms, end_ms, overlaps_previous) tuples. Speech that runs
+    longer than max_chunk_ms without a pause is cut hard, with overlap_ms of
+    overlap so no word is lost at the cut.
+    """
+    if len(audio) <= max_chunk_ms:
+        return [(0, len(audio), False)]
+
+    speech = detect_nonsilent(audio, min_silence_len=min_silence_ms, silence_thresh=audio.dBFS - silence_offset_db)
+    if not speech:
+        return [(0, len(audio), False)]
+
+    # Each chunk keeps up to half a pause of padding on both sides
+    pad = min_silence_ms // 2
+    budget = max_chunk_ms - 2 * pad
+
+    # Break speech runs longer than the budget into overlapping pieces
+    pieces = []
+    for start, end in speech:
+        overlaps = False
+        while end - start > budget:
+            pieces.append((start, start + budget, overlaps))
+            start += budget - overlap_ms
+            overlaps = True
+        pieces.append((start, end, overlaps))
+
+    # Greedily merge neighbouring pieces separated by silence
+    groups = []
+    for start, end, overlaps in pieces:
+        if groups and not overlaps and end - groups[-1][0] <= budget:
+            groups[-1][1] = end
+        else:
+            groups.append([start, end, overlaps])
+    return [(max(0, start - pad), min(len(audio), end + pad), overlaps) for start, end, overlaps in groups]
+
+
+def _words(text):
+    return [re.sub(r"[^\w']", "", word).lower() for word in text.split()]
+
+
+def stitch_transcripts(texts, overlaps, max_overlap_words=20):
+    """Join chunk transcripts in order, dropping words repeated across an overlap."""
+    stitched = []
+    for text, overlaps_previous in zip(texts, overlaps):
+        words = text.split()
+        if overlaps_previous and stitched:
+            previous = _words(" ".join(stitched[-max_overlap_words:]))
+            current = _words(" ".join(words[:max_overlap_words]))
+            for size in range(min(len(previous), len(current)), 0, -1):
+                if previous[-size:] == current[:size]:
+                    words = words[size:]
+                    break
+        stitched.extend(words)
+    return " ".join(stitched)
+
+
+def _transcribe_chunk(index, audio, start_ms, end_ms):
+    buffer = io.BytesIO()
+    audio[start_ms:end_ms].export(buffer, format="wav")
+    started = time.perf_counter()
+    transcript = client.audio.transcriptions.create(
+        model=WHISPER_MODEL,
+        file=(f"chunk_{index:03d}.wav", buffer.getvalue())
+    )
+    return transcript.text, {
+        "index": index,
+        "start_ms": start_ms,
+        "end_ms": end_ms,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def transcribe_chunked(file_path: str, max_workers: int = CHUNK_WORKERS, max_chunk_ms: int = 5 * 60 * 1000,
+                       overlap_ms: int = 2000) -> dict:
+    """Transcribe a long recording as concurrent silence-split chunks.
+
+    Returns {"text": ..., "chunks": [{"index", "start_ms", "end_ms", "seconds"}, ...]}.
+    """
+    # 16 kHz mono keeps each chunk well under the upload limit
+    audio = AudioSegment.from_file(file_path).set_frame_rate(16000).set_channels(1)
+    chunks = split_audio(audio, max_chunk_ms=max_chunk_ms, overlap_ms=overlap_ms)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_transcribe_chunk, i, audio, start, end) for i, (start, end, _) in enumerate(chunks)]
+        results = [future.result() for future in futures]
+
+    for timing in (timing for _, timing in results):
+        print(f"🧩 Chunk {timing['index']} ({timing['start_ms']}–{timing['end_ms']} ms): {timing['seconds']}s")
+
+    text = stitch_transcripts([text for text, _ in results], [overlaps for _, _, overlaps in chunks])
+    return {"text": text, "chunks": [timing for _, timing in results]}
@@ -0,0 +1,109 @@
+# rule_based_extractor.py
+#
+# Deterministic extractor for simple utterances such as "two bananas and 200 ml milk".
+# It returns the same {"extracted", "quantity", "unit"} records as the LLM plus a
+# coverage-based confidence; entity_extractor only calls the LLM when that is low.
+
+import os
+import re
+
+from food_lexicon import UNITS, load_food_lexicon
+from number_normalizer import FRACTIONS, VAGUE_QUANTITIES, normalize_numbers
+
+RULE_CONFIDENCE_THRESHOLD = float(os.getenv("RULE_CONFIDENCE_THRESHOLD", "0.85"))
+
+ARTICLES = {"a", "an"}
+# Words that carry no food information and so do not lower coverage
+FILLER_WORDS = {
+    "i", "i'm", "i've", "we", "had", "have", "ate", "eaten", "eat", "drank", "drink", "drunk", "just",
+    "and", "with", "plus", "also", "then", "of", "the", "my", "for", "at", "in", "on", "to", "as",
+    "breakfast", "lunch", "dinner", "snack", "today", "this", "morning", "evening", "afternoon",
+    "yesterday", "tonight", "about", "around", "approximately", "roughly",
+}
+
+# "no milk", "coffee without sugar": the rules cannot tell what was not eaten, so the LLM decides
+NEGATION_WORDS = {
+    "no", "not", "without", "didn't", "didnt", "don't", "dont", "never", "none", "nothing",
+    "except", "instead", "skip", "skipped",
+}
+
+# Two foods count as separate items only with one of these between them; "chicken curry" is one dish
+SEPARATORS = {"and", "with", "plus", ","}
+
+RESERVED_WORDS = FILLER_WORDS | ARTICLES | VAGUE_QUANTITIES | set(UNITS) | set(FRACTIONS)
+
+_TOKEN_RE = re.compile(r"\d+(?:[.,]\d+)?|[a-z]+(?:'[a-z]+)?|,")
+
+
+def _food_at(tokens, start, lexicon):
+    # Longest lexicon phrase starting at tokens[start]; a few csv_foods entries
+    # ("for", "slice") must stay function words here
+    food, length = lexicon.longest_at(tokens, start)
+    if food in RESERVED_WORDS:
+        return None, 0
+    return food, length
+
+
+def _parse_quantity(token):
+    try:
+        value = float(token.replace(",", "."))
+    except ValueError:
+        return None
+    return int(value) if value.is_integer() else value
+
+
+def extract_with_rules(transcript):
+    """Return (entities, confidence); confidence is the share of words the rules explained.
+    "extracted" is the food as said ("bananas"), so the highlighter finds it in the transcript."""
+    lexicon = load_food_lexicon()
+    tokens = _TOKEN_RE.findall(normalize_numbers(transcript).lower())
+    if not tokens:
+        return [], 0.0
+    negated = not NEGATION_WORDS.isdisjoint(tokens)
+
+    entities = []
+    explained = 0
+    quantity, unit, pending = None, None, 0
+    separated = True
+    fused = False
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        food, length = _food_at(tokens, i, lexicon)
+        # After a quantity, a unit word is the unit even if "ml milk" happens to be in the list
+        if food and not (token in UNITS and quantity is not None):
+            entities.append({"extracted": " ".join(tokens[i:i + length]), "quantity": quantity, "unit": unit})
+            # "chicken curry", "bread butter": adjacent foods may be one dish, which the rules cannot tell
+            fused = fused or not separated
+            explained += length + pending
+            quantity, unit, pending = None, None, 0
+            separated = False
+            i += length
+            continue
+
+        number = _parse_quantity(token)
+        if number is not None:
+            quantity, unit, pending = number, "piece", 1
+        elif token in ARTICLES and quantity is None:
+            # "a coffee" is one of whatever it comes in, not a "piece"
+            quantity, unit, pending = 1, "portion", 1
+        elif token in ARTICLES:
+            # "0.75 of a pizza": the article belongs to the quantity already given
+            pending += 1
+        elif token in VAGUE_QUANTITIES:
+            quantity, unit, pending = token, None, 1
+        elif token in UNITS and quantity is not None:
+            unit, pending = UNITS[token], pending + 1
+        elif token in SEPARATORS:
+            separated = True
+            explained += 1
+        elif token in FILLER_WORDS:
+            explained += 1
+        else:
+            # An unknown word breaks any quantity that was waiting for its food
+            quantity, unit, pending = None, None, 0
+        i += 1
+
+    if negated or fused:
+        return entities, 0.0
+    return entities, round(explained / len(tokens), 3)
@@ -0,0 +1,157 @@
+# stt_engines.py
+
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Comma-separated engine names; with several engines STT_MODE picks "race" or "fallback"
+STT_ENGINES = os.getenv("STT_ENGINES", "openai")
+STT_MODE = os.getenv("STT_MODE", "race")
+STT_TIMEOUT = float(os.getenv("STT_TIMEOUT", "60"))
+
+NO_TRANSCRIPT = "No transcription available."
+
+
+class TranscriptionError(RuntimeError):
+    pass
+
+
+class Transcriber:
+    """One speech-to-text engine: transcribe(file_path) -> text."""
+
+    name = None
+
+    def transcribe(self, file_path: str) -> str:
+        raise NotImplementedError
+
+
+class OpenAITranscriber(Transcriber):
+    name = "openai"
+
+    def transcribe(self, file_path: str) -> str:
+        from openai_stt import transcribe_with_openai
+
+        return transcribe_with_openai(file_path)
+
+
+class WatsonTranscriber(Transcriber):
+    name = "watson"
+
+    def transcribe(self, file_path: str) -> str:
+        from watson_stt import transcribe_audio
+
+        return transcribe_audio(file_path)
+
+
+class LocalTranscriber(Transcriber):
+    name = "local"
+
+    def transcribe(self, file_path: str) -> str:
+        from local_stt import transcribe_locally
+
+        return transcribe_locally(file_path)
+
+
+_registry = {}
+
+
+def register_transcriber(transcriber):
+    _registry[transcriber.name] = transcriber
+    return transcriber
+
+
+def get_transcriber(name):
+    try:
+        return _registry[name]
+    except KeyError:
+        raise TranscriptionError(f"Unknown STT engine '{name}'. Available: {', '.join(sorted(_registry))}")
+
+
+def available_transcribers():
+    return sorted(_registry)
+
+
+register_transcriber(OpenAITranscriber())
+register_transcriber(WatsonTranscriber())
+register_transcriber(LocalTranscriber())
+
+
+def is_acceptable(text):
+    return bool(text and text.strip() and text != NO_TRANSCRIPT)
+
+
+def race(file_path, engines, timeout=STT_TIMEOUT, accept=is_acceptable):
+    """Send the audio to every engine at once and return (text, engine) of the first acceptable result.
+
+    Engines that have not started are cancelled; running ones are abandoned
+    (a thread cannot be interrupted) and their results ignored.
+    """
+    transcribers = [get_transcriber(name) for name in engines]
+    executor = ThreadPoolExecutor(max_workers=len(transcribers), thread_name_prefix="stt-race")
+    started = time.perf_counter()
+    pending = {executor.submit(t.transcribe, file_path): t.name for t in transcribers}
+    errors = {}
+    try:
+        while pending:
+            remaining = timeout - (time.perf_counter() - started)
+            if remaining <= 0:
+                break
+            done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    text = future.result()
+                except Exception as e:
+                    errors[name] = e
+                    continue
+                if accept(text):
+                    print(f"🏁 {name} answered first in {time.perf_counter() - started:.2f}s")
+                    return text, name
+                errors[name] = TranscriptionError("unacceptable result")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    for name in pending.values():
+        errors[name] = TimeoutError(f"no result within {timeout}s")
+    raise TranscriptionError(f"All STT engines failed: {errors}")
+
+
+def fallback(file_path, engines, timeout=STT_TIMEOUT, accept=is_acceptable):
+    """Try engines in order, moving on after an error, a bad result or a per-engine timeout.
+
+    timeout is one value for every engine or a {engine: seconds} dict.
+    """
+    errors = {}
+    for name in engines:
+        transcriber = get_transcriber(name)
+        engine_timeout = timeout.get(name, STT_TIMEOUT) if isinstance(timeout, dict) else timeout
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"stt-{name}")
+        started = time.perf_counter()
+        future = executor.submit(transcriber.transcribe, file_path)
+        try:
+            text = future.result(timeout=engine_timeout)
+        except Exception as e:
+            errors[name] = e
+            print(f"⚠️ {name} failed after {time.perf_counter() - started:.2f}s: {e!r}")
+            continue
+        finally:
+            executor.shutdown(wait=False)
+        if accept(text):
+            return text, name
+        errors[name] = TranscriptionError("unacceptable result")
+    raise TranscriptionError(f"All STT engines failed: {errors}")
+
+
+def transcribe(file_path: str, engines=None, mode=None, timeout=None) -> str:
+    """Transcribe with the configured engines (STT_ENGINES / STT_MODE / STT_TIMEOUT)."""
+    engines = engines or [name.strip() for name in STT_ENGINES.split(",") if name.strip()]
+    mode = mode or STT_MODE
+    timeout = timeout if timeout is not None else STT_TIMEOUT
+
+    if len(engines) == 1:
+        return get_transcriber(engines[0]).transcribe(file_path)
+    if mode == "race":
+        return race(file_path, engines, timeout)[0]
+    if mode == "fallback":
+        return fallback(file_path, engines, timeout)[0]
+    raise TranscriptionError(f"Unknown STT mode '{mode}'. Use 'race' or 'fallback'.")
@@ -1,53 +1,470 @@
 # swiss_food_matcher.py
 
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+
+import numpy as np
 import pandas as pd
-from sentence_transformers import SentenceTransformer, util
+from rapidfuzz import fuzz, process, utils
+
+from food_lexicon import _singular, short_names
+from lru_cache import LRUCache
+from vector_index import BruteForceIndex, load_vector_index
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+INDEX_DIR_NAME = ".food_index"
+# Lexical tiers answer before the model; fuzzy hits below this score fall through to it
+FUZZY_THRESHOLD = 0.9
+DEFAULT_ALIASES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "food_aliases.csv")
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "2048"))
+# Optional SQLite file that keeps query embeddings across process restarts
+QUERY_CACHE_PATH = os.getenv("QUERY_CACHE_PATH")
+
+# Models are created on first use and shared process-wide
+_models = {}
+_model_lock = threading.Lock()
+_warm_up_thread = None
+_warm_up_lock = threading.Lock()
+_index_lock = threading.Lock()
+_matchers = {}
+
+# Indexes already opened in this process, keyed by (csv_path, mtime, size, model)
+_open_indexes = {}
+
+
+def get_model(model_name=MODEL_NAME):
+    model = _models.get(model_name)
+    if model is None:
+        with _model_lock:
+            model = _models.get(model_name)
+            if model is None:
+                # Imported here so importing this module does not pull in torch
+                from sentence_transformers import SentenceTransformer
+
+                model = SentenceTransformer(model_name)
+                _models[model_name] = model
+    return model
+
+
+def warm_up(csv_path=None, model_name=MODEL_NAME, background=True):
+    """Load the model (and optionally the food index) ahead of the first lookup."""
+    global _warm_up_thread
+
+    def _load():
+        get_model(model_name)
+        if csv_path is not None:
+            load_embedding_index(csv_path, model_name)
+
+    if not background:
+        _load()
+        return None
+    with _warm_up_lock:
+        if _warm_up_thread is not None and _warm_up_thread.is_alive():
+            return _warm_up_thread
+        # Nothing to do only when both the model and this CSV's index are already in memory
+        if model_name in _models and (csv_path is None or _open_index_key(csv_path, model_name) in _open_indexes):
+            return _warm_up_thread
+        _warm_up_thread = threading.Thread(target=_load, name="food-matcher-warm-up", daemon=True)
+        _warm_up_thread.start()
+        return _warm_up_thread
+
+
+def _index_key(csv_path, model_name):
+    # The index is tied to the exact CSV contents and the model that encoded it
+    digest = hashlib.sha256()
+    with open(csv_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    digest.update(model_name.encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def _index_paths(csv_path, key):
+    index_dir = os.path.join(os.path.dirname(os.path.abspath(csv_path)), INDEX_DIR_NAME)
+    stem = os.path.splitext(os.path.basename(csv_path))[0]
+    base = os.path.join(index_dir, f"{stem}.{key}")
+    return index_dir, stem, base + ".npy", base + ".json"
+
+
+def _index_base(csv_path, key):
+    return _index_paths(csv_path, key)[2][:-len(".npy")]
+
+
+def index_base_path(csv_path, model_name=MODEL_NAME):
+    """Path prefix shared by every index file for the current CSV contents and model."""
+    return _index_base(csv_path, _index_key(csv_path, model_name))
 
-# Load model once
-model = SentenceTransformer("all-MiniLM-L6-v2")
 
-def load_food_database(csv_path):
+def _remove_stale_indexes(index_dir, stem, keep_key, model_name):
+    # Older indexes of this CSV for the same model; other models' indexes stay usable
+    stale_keys = set()
+    for filename in os.listdir(index_dir):
+        key = filename[len(stem) + 1:-len(".json")]
+        if not (filename.startswith(stem + ".") and filename.endswith(".json")) or "." in key or key == keep_key:
+            continue
+        try:
+            with open(os.path.join(index_dir, filename), encoding="utf-8") as f:
+                if json.load(f).get("model") == model_name:
+                    stale_keys.add(key)
+        except (OSError, ValueError):
+            pass
+    for filename in os.listdir(index_dir):
+        if any(filename.startswith(f"{stem}.{key}.") for key in stale_keys):
+            try:
+                os.remove(os.path.join(index_dir, filename))
+            except OSError:
+                pass
+
+
+def build_embedding_index(csv_path, model_name=MODEL_NAME):
     df = pd.read_csv(csv_path)
-    df["name_clean"] = df["name"].str.strip().str.lower()
-    df["embedding"] = model.encode(df["name_clean"].tolist(), convert_to_tensor=True).tolist()
-    return df
+    key = _index_key(csv_path, model_name)
+    index_dir, stem, matrix_path, sidecar_path = _index_paths(csv_path, key)
+    os.makedirs(index_dir, exist_ok=True)
+
+    names_clean = df["name"].str.strip().str.lower().tolist()
+    embeddings = get_model(model_name).encode(names_clean, convert_to_numpy=True, normalize_embeddings=True)
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+
+    # Write to temp files first so a crash never leaves a half-written index behind
+    tmp_matrix = matrix_path + ".tmp"
+    with open(tmp_matrix, "wb") as f:
+        np.save(f, embeddings)
+    tmp_sidecar = sidecar_path + ".tmp"
+    with open(tmp_sidecar, "w", encoding="utf-8") as f:
+        json.dump({"key": key, "model": model_name, "ID": df["ID"].tolist(), "name": df["name"].tolist()}, f)
+    os.replace(tmp_matrix, matrix_path)
+    os.replace(tmp_sidecar, sidecar_path)
+
+    _remove_stale_indexes(index_dir, stem, key, model_name)
+    print(f"🧱 Built embedding index for {len(df)} foods: {matrix_path}")
+    return matrix_path, sidecar_path
+
+
+def _open_index_key(csv_path, model_name):
+    stat = os.stat(csv_path)
+    return os.path.abspath(csv_path), stat.st_mtime_ns, stat.st_size, model_name
+
+
+def load_embedding_index(csv_path, model_name=MODEL_NAME):
+    cache_key = _open_index_key(csv_path, model_name)
+    if cache_key in _open_indexes:
+        return _open_indexes[cache_key]
+
+    with _index_lock:
+        if cache_key in _open_indexes:
+            return _open_indexes[cache_key]
+
+        key = _index_key(csv_path, model_name)
+        _, _, matrix_path, sidecar_path = _index_paths(csv_path, key)
+        if not (os.path.exists(matrix_path) and os.path.exists(sidecar_path)):
+            build_embedding_index(csv_path, model_name)
+
+        with open(sidecar_path, encoding="utf-8") as f:
+            sidecar = json.load(f)
+        # Memory-mapped, so loading costs no copy and no encoding
+        embeddings = np.load(matrix_path, mmap_mode="r")
+
+        index = (np.asarray(sidecar["ID"]), sidecar["name"], embeddings, sidecar["key"])
+        _open_indexes[cache_key] = index
+        return index
+
+
+class QueryEmbeddingStore:
+    """Small SQLite store so repeated queries survive process restarts."""
+
+    def __init__(self, path, max_rows=50000):
+        self.path = path
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS query_embeddings ("
+            "model TEXT NOT NULL, text TEXT NOT NULL, embedding BLOB NOT NULL, "
+            "PRIMARY KEY (model, text))"
+        )
+        self._conn.commit()
+
+    def get_many(self, model_name, texts):
+        found = {}
+        with self._lock:
+            for text in texts:
+                row = self._conn.execute(
+                    "SELECT embedding FROM query_embeddings WHERE model = ? AND text = ?", (model_name, text)
+                ).fetchone()
+                if row is not None:
+                    found[text] = np.frombuffer(row[0], dtype=np.float32)
+        return found
+
+    def put_many(self, model_name, items):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO query_embeddings (model, text, embedding) VALUES (?, ?, ?)",
+                [(model_name, text, np.asarray(emb, dtype=np.float32).tobytes()) for text, emb in items],
+            )
+            # Keep the store small by dropping the oldest rows
+            self._conn.execute(
+                "DELETE FROM query_embeddings WHERE rowid IN ("
+                "SELECT rowid FROM query_embeddings ORDER BY rowid DESC LIMIT -1 OFFSET ?)",
+                (self.max_rows,),
+            )
+            self._conn.commit()
+
+
+# Query embeddings depend only on (text, model); match results also on the database version
+_embedding_cache = LRUCache(QUERY_CACHE_SIZE)
+_result_cache = LRUCache(QUERY_CACHE_SIZE)
+_embedding_store = QueryEmbeddingStore(QUERY_CACHE_PATH) if QUERY_CACHE_PATH else None
+
+
+def configure_query_cache(max_size=None, persist_path=None):
+    global _embedding_cache, _result_cache, _embedding_store
+    if max_size is not None:
+        _embedding_cache = LRUCache(max_size)
+        _result_cache = LRUCache(max_size)
+    if persist_path is not None:
+        _embedding_store = QueryEmbeddingStore(persist_path)
+
+
+def query_cache_stats():
+    return {"embeddings": _embedding_cache.stats(), "results": _result_cache.stats()}
+
+
+def normalize_query(text):
+    return re.sub(r"\s+", " ", str(text).strip().lower())
+
+
+def load_aliases(aliases_path=DEFAULT_ALIASES_PATH):
+    if not aliases_path or not os.path.exists(aliases_path):
+        return {}
+    df = pd.read_csv(aliases_path)
+    return dict(zip(df["alias"], df["ID"]))
+
+
+class FoodMatcher:
+    """Scores queries against one contiguous, pre-normalized float32 matrix."""
+
+    def __init__(self, ids, names, embeddings, version=None, model_name=MODEL_NAME, aliases=None, vector_index=None):
+        self.ids = np.asarray(ids)
+        self.names = list(names)
+        self.version = version
+        self.model_name = model_name
+        # Rows are L2-normalized at index build time, so cosine similarity is a dot product
+        self.embeddings = embeddings if embeddings.flags["C_CONTIGUOUS"] else np.ascontiguousarray(embeddings)
+        self.vector_index = vector_index or BruteForceIndex(self.embeddings)
+        self.fuzzy_threshold = FUZZY_THRESHOLD
+        self._build_lexicon(aliases or {})
+
+    def _build_lexicon(self, aliases):
+        self._exact = {}
+        for idx, name in enumerate(self.names):
+            self._exact.setdefault(normalize_query(name), idx)
+
+        # "Bread (average)" -> "bread", "Banana, raw" -> "banana"; the shortest full name wins
+        self._alias = {}
+        for idx in sorted(range(len(self.names)), key=lambda i: len(self.names[i])):
+            for alias in short_names(self.names[idx]):
+                if alias not in self._exact:
+                    self._alias.setdefault(alias, idx)
+
+        # Curated aliases point at IDs and override the derived ones
+        id_to_idx = {str(food_id): idx for idx, food_id in enumerate(self.ids)}
+        for alias, food_id in aliases.items():
+            if str(food_id) in id_to_idx:
+                self._alias[normalize_query(alias)] = id_to_idx[str(food_id)]
+
+        # Fuzzy choices are full names and short names, pre-processed once (lowercase, punctuation stripped)
+        fuzzy = {}
+        for name, idx in list(self._exact.items()) + list(self._alias.items()):
+            fuzzy.setdefault(utils.default_process(name), idx)
+        self._choices = list(fuzzy)
+        self._choice_idx = list(fuzzy.values())
+
+    @classmethod
+    def from_csv(cls, csv_path, model_name=MODEL_NAME, aliases_path=DEFAULT_ALIASES_PATH):
+        ids, names, embeddings, version = load_embedding_index(csv_path, model_name)
+        # Reuse the matcher (and its lexicon) across Streamlit reruns
+        matcher_key = (version, model_name, aliases_path)
+        matcher = _matchers.get(matcher_key)
+        if matcher is None:
+            vector_index = load_vector_index(embeddings, _index_base(csv_path, version))
+            matcher = cls(ids, names, embeddings, version, model_name, load_aliases(aliases_path), vector_index)
+            _matchers[matcher_key] = matcher
+        return matcher
+
+    def __len__(self):
+        return len(self.names)
+
+    def encode(self, texts):
+        return get_model(self.model_name).encode(texts, convert_to_numpy=True, normalize_embeddings=True).astype(np.float32, copy=False)
+
+    def top_k(self, query_embeddings, k=5):
+        return self.vector_index.search(query_embeddings, k)
+
+    def _result(self, entity, idx, score, threshold, tier):
+        if idx is not None and score >= threshold:
+            return {
+                "extracted": entity["extracted"],
+                "recognized": self.names[idx],
+                "quantity": entity.get("quantity"),
+                "unit": entity.get("unit"),
+                "ID": self.ids[idx],
+                "score": round(score, 3),
+                "tier": tier
+            }
+        else:
+            return {
+                "extracted": entity["extracted"],
+                "recognized": None,
+                "quantity": entity.get("quantity"),
+                "unit": entity.get("unit"),
+                "ID": None,
+                "score": round(score, 3),
+                "tier": tier
+            }
+
+    def _tokens_agree(self, query, choice):
+        # A typo fix, not a different food: same words in the same order, each one close
+        # ("banan" -> "banana", but not "oat milk" -> "goat milk" or "almond milk" -> "almond")
+        query_tokens, choice_tokens = query.split(), choice.split()
+        return len(query_tokens) == len(choice_tokens) and all(
+            fuzz.ratio(q, c) >= self.fuzzy_threshold * 100 for q, c in zip(query_tokens, choice_tokens)
+        )
+
+    def lexical_match(self, text):
+        """Exact name, then alias, then fuzzy typo match; (idx, score, tier) or None."""
+        keys = list(dict.fromkeys((text, _singular(text))))
+        for key in keys:
+            if key in self._exact:
+                return self._exact[key], 1.0, "exact"
+        for key in keys:
+            if key in self._alias:
+                return self._alias[key], 1.0, "alias"
+
+        query = utils.default_process(text)
+        hits = process.extract(query, self._choices, scorer=fuzz.ratio, processor=None,
+                               score_cutoff=self.fuzzy_threshold * 100, limit=5)
+        # Anything else (extra or missing words, reordered words) is left to the semantic tier
+        for choice, score, pos in hits:
+            if self._tokens_agree(query, choice):
+                return self._choice_idx[pos], round(score / 100, 3), "fuzzy"
+        return None
+
+    def encode_queries(self, texts):
+        # Cached texts skip the transformer; the rest are encoded in one batch
+        embeddings = {}
+        missing = []
+        for text in texts:
+            cached = _embedding_cache.get((text, self.model_name))
+            if cached is not None:
+                embeddings[text] = cached
+            elif text not in missing:
+                missing.append(text)
+
+        if missing and _embedding_store is not None:
+            for text, emb in _embedding_store.get_many(self.model_name, missing).items():
+                embeddings[text] = emb
+                _embedding_cache.put((text, self.model_name), emb)
+            missing = [text for text in missing if text not in embeddings]
+
+        if missing:
+            encoded = self.encode(missing)
+            for text, emb in zip(missing, encoded):
+                embeddings[text] = emb
+                _embedding_cache.put((text, self.model_name), emb)
+            if _embedding_store is not None:
+                _embedding_store.put_many(self.model_name, zip(missing, encoded))
+
+        return np.stack([embeddings[text] for text in texts])
+
+    def _ranked(self, input_texts, top_k):
+        ranked = {}
+        missing = []
+        for text in input_texts:
+            cached = _result_cache.get((text, self.model_name, self.version, top_k))
+            if cached is not None:
+                ranked[text] = cached
+            elif text not in missing:
+                missing.append(text)
+
+        if missing:
+            top_indices, top_scores = self.top_k(self.encode_queries(missing), top_k)
+            for text, indices, scores in zip(missing, top_indices, top_scores):
+                ranked[text] = (indices, scores)
+                _result_cache.put((text, self.model_name, self.version, top_k), (indices, scores))
+        return [ranked[text] for text in input_texts]
+
+    def match_many(self, entities, threshold=0.7, top_k=5, fill_candidates=False):
+        if not entities:
+            return [], []
+        input_texts = [normalize_query(entity["extracted"]) for entity in entities]
+
+        lexical_hits = []
+        for text in input_texts:
+            hit = self.lexical_match(text)
+            lexical_hits.append(hit if hit is not None and hit[1] >= threshold else None)
+
+        # Only entities no lexical tier could answer go through the model, unless
+        # the caller wants full candidate lists for the lexical hits as well
+        semantic_texts = [text for text, hit in zip(input_texts, lexical_hits) if hit is None or fill_candidates]
+        ranked = dict(zip(semantic_texts, self._ranked(semantic_texts, top_k))) if semantic_texts else {}
+
+        results = []
+        candidates = []
+        for entity, input_text, hit in zip(entities, input_texts, lexical_hits):
+            if hit is not None:
+                idx, score, tier = hit
+                print(f"\n⚡ {tier.capitalize()} match for '{input_text}': {self.names[idx]} (ID: {self.ids[idx]}) – Score: {score}")
+                results.append(self._result(entity, idx, score, threshold, tier))
+                entity_candidates = [{"name": self.names[idx], "ID": self.ids[idx], "score": score}]
+                if fill_candidates:
+                    indices, scores = ranked[input_text]
+                    entity_candidates += [
+                        {"name": self.names[other], "ID": self.ids[other], "score": round(float(other_score), 3)}
+                        for other, other_score in zip(indices, scores) if other not in (idx, -1)
+                    ][:top_k - 1]
+                candidates.append(entity_candidates)
+                continue
+
+            indices, scores = ranked[input_text]
+            print(f"\n🔍 Matching for: '{input_text}'")
+            entity_candidates = []
+            for i, idx in enumerate(indices):
+                if idx < 0:
+                    # IVF padding: the probed lists held fewer than top_k rows
+                    break
+                score = round(float(scores[i]), 3)
+                print(f"{i+1}. {self.names[idx]} (ID: {self.ids[idx]}) – Score: {score}")
+                entity_candidates.append({"name": self.names[idx], "ID": self.ids[idx], "score": score})
+
+            if entity_candidates:
+                results.append(self._result(entity, indices[0], float(scores[0]), threshold, "semantic"))
+            else:
+                results.append(self._result(entity, None, 0.0, threshold, "semantic"))
+            candidates.append(entity_candidates)
+        return results, candidates
+
+    def match(self, entity, threshold=0.7):
+        results, _ = self.match_many([entity], threshold)
+        return results[0]
+
+
+def load_food_database(csv_path, model_name=MODEL_NAME):
+    return FoodMatcher.from_csv(csv_path, model_name)
 
 def match_entity(entity, food_db, threshold=0.7):
-    input_text = entity["extracted"].strip().lower()
-    input_embedding = model.encode(input_text, convert_to_tensor=True)
-
-    # Compute similarity scores to all food items
-    scores = util.pytorch_cos_sim(input_embedding, food_db["embedding"].tolist())[0]
-
-    # Get top 5 matches
-    top_indices = scores.topk(5).indices.tolist()
-    top_scores = scores[top_indices].tolist()
-
-    print(f"\n🔍 Matching for: '{input_text}'")
-    for i, idx in enumerate(top_indices):
-        match = food_db.iloc[idx]
-        score = top_scores[i]
-        print(f"{i+1}. {match['name']} (ID: {match['ID']}) – Score: {round(score, 3)}")
-
-    top_idx = top_indices[0]
-    top_score = top_scores[0]
-
-    if top_score >= threshold:
-        matched = food_db.iloc[top_idx]
-        return {
-            "extracted": entity["extracted"],
-            "recognized": matched["name"],
-            "quantity": entity.get("quantity"),
-            "unit": entity.get("unit"),
-            "ID": matched["ID"],
-            "score": round(top_score, 3)
-        }
-    else:
-        return {
-            "extracted": entity["extracted"],
-            "recognized": None,
-            "quantity": entity.get("quantity"),
-            "unit": entity.get("unit"),
-            "ID": None,
-            "score": round(top_score, 3)
-        }
+    return food_db.match(entity, threshold)
+
+def match_entities(entities, food_db, threshold=0.7, top_k=5, fill_candidates=False):
+    """Match all entities with one batched encode and one matrix product.
+
+    Returns (results, candidates): results[i] is the match_entity dict for
+    entities[i], candidates[i] its top_k {"name", "ID", "score"} list. An entity
+    answered by the exact/alias/fuzzy tiers gets only that one candidate, unless
+    fill_candidates is set, which ranks it semantically as well to fill the list.
+    """
+    return food_db.match_many(entities, threshold, top_k, fill_candidates)
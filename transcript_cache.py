@@ -0,0 +1,135 @@
+# transcript_cache.py
+
+import functools
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+from lru_cache import LRUCache
+from stt_engines import is_acceptable
+
+TRANSCRIPT_CACHE_DIR = os.getenv(
+    "TRANSCRIPT_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".transcript_cache")
+)
+TRANSCRIPT_CACHE_MAX_BYTES = int(os.getenv("TRANSCRIPT_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+# Benchmarks turn the cache off so every call reaches the engine
+_enabled = os.getenv("TRANSCRIPT_CACHE", "on") != "off"
+
+
+def audio_digest(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class TranscriptCache:
+    """Transcripts keyed by (SHA-256 of the audio bytes, engine/model id).
+
+    An in-memory LRU sits in front of a directory of small JSON files whose
+    total size is kept under max_disk_bytes by evicting the least recently used.
+    """
+
+    def __init__(self, cache_dir=TRANSCRIPT_CACHE_DIR, max_entries=256, max_disk_bytes=TRANSCRIPT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.memory = LRUCache(max_entries)
+        self.disk_hits = 0
+        self.disk_evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, digest, engine):
+        return os.path.join(self.cache_dir, f"{digest}.{re.sub(r'[^A-Za-z0-9_-]', '_', engine)}.json")
+
+    def get(self, digest, engine):
+        text = self.memory.get((digest, engine))
+        if text is not None:
+            return text
+
+        path = self._path(digest, engine)
+        try:
+            with open(path, encoding="utf-8") as f:
+                text = json.load(f)["text"]
+            os.utime(path)  # mark as recently used for eviction
+        except (OSError, ValueError, KeyError):
+            return None
+        with self._lock:
+            self.disk_hits += 1
+        self.memory.put((digest, engine), text)
+        return text
+
+    def put(self, digest, engine, text):
+        self.memory.put((digest, engine), text)
+        path = self._path(digest, engine)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"engine": engine, "text": text, "created": time.time()}, f)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith(".json"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_disk_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                self.disk_evictions += 1
+
+    def stats(self):
+        return {"memory": self.memory.stats(), "disk_hits": self.disk_hits, "disk_evictions": self.disk_evictions}
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_transcript_cache():
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = TranscriptCache()
+        return _default_cache
+
+
+def set_transcript_cache_enabled(enabled):
+    global _enabled
+    _enabled = enabled
+
+
+def cached_transcription(engine):
+    """Decorate a transcribe(file_path) -> str function with the shared transcript cache."""
+
+    def decorator(transcribe):
+        @functools.wraps(transcribe)
+        def wrapper(file_path, *args, **kwargs):
+            if not _enabled:
+                return transcribe(file_path, *args, **kwargs)
+            cache = get_transcript_cache()
+            digest = audio_digest(file_path)
+            text = cache.get(digest, engine)
+            if text is not None:
+                return text
+            text = transcribe(file_path, *args, **kwargs)
+            # Failures (empty text, "No transcription available.") are retried next time, not cached
+            if is_acceptable(text):
+                cache.put(digest, engine, text)
+            return text
+
+        return wrapper
+
+    return decorator
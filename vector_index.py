@@ -0,0 +1,140 @@
+# vector_index.py
+#
+# Vector indexes behind FoodMatcher. Small tables use exact brute force;
+# large ones use an IVF (inverted file) index: rows are clustered around
+# k-means centroids and a query only scores the rows of its nprobe
+# closest clusters. IVF indexes are built offline and loaded memory-mapped:
+#
+#     python vector_index.py build swiss_food_composition_database_small.csv
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+# Tables at least this large use the IVF index when one has been built
+ANN_MIN_ROWS = int(os.getenv("ANN_MIN_ROWS", "50000"))
+
+
+def _top_k_rows(scores, k):
+    k = min(k, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+class BruteForceIndex:
+    kind = "brute"
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+
+    def search(self, queries, k=5):
+        # (queries x dim) @ (dim x rows) -> one score row per query
+        return _top_k_rows(np.atleast_2d(queries) @ self.embeddings.T, k)
+
+
+class IVFIndex:
+    kind = "ivf"
+
+    def __init__(self, embeddings, centroids, order, offsets, nprobe=None):
+        self.embeddings = embeddings
+        self.centroids = centroids
+        # Row ids grouped by cluster: cluster c owns order[offsets[c]:offsets[c + 1]]
+        self.order = order
+        self.offsets = offsets
+        self.nprobe = nprobe or max(8, len(centroids) // 16)
+
+    @classmethod
+    def build(cls, embeddings, nlist=None, iterations=10, sample_size=50000, seed=0):
+        rng = np.random.default_rng(seed)
+        n = len(embeddings)
+        nlist = min(nlist or int(4 * np.sqrt(n)), n)
+
+        # Spherical k-means on a sample; the rows are already L2-normalized
+        sample = embeddings[rng.choice(n, min(sample_size, n), replace=False)]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = sample[assignment == c]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    centroids[c] = centroid / (np.linalg.norm(centroid) or 1.0)
+
+        assignment = np.empty(n, dtype=np.int64)
+        for start in range(0, n, 65536):
+            assignment[start:start + 65536] = np.argmax(embeddings[start:start + 65536] @ centroids.T, axis=1)
+        order = np.argsort(assignment, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=nlist))])
+        return cls(embeddings, centroids.astype(np.float32), order.astype(np.int64), offsets.astype(np.int64))
+
+    def save(self, base_path):
+        for name in ("centroids", "order", "offsets"):
+            tmp_path = f"{base_path}.ivf.{name}.npy.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, getattr(self, name))
+            os.replace(tmp_path, f"{base_path}.ivf.{name}.npy")
+
+    @classmethod
+    def load(cls, embeddings, base_path, nprobe=None):
+        arrays = [np.load(f"{base_path}.ivf.{name}.npy", mmap_mode="r") for name in ("centroids", "order", "offsets")]
+        return cls(embeddings, *arrays, nprobe=nprobe)
+
+    @staticmethod
+    def exists(base_path):
+        return all(os.path.exists(f"{base_path}.ivf.{name}.npy") for name in ("centroids", "order", "offsets"))
+
+    def search(self, queries, k=5):
+        queries = np.atleast_2d(queries)
+        nprobe = min(self.nprobe, len(self.centroids))
+        probes = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+
+        # Slots the probed lists cannot fill stay at row -1 with score -inf
+        all_indices = np.full((len(queries), k), -1, dtype=np.int64)
+        all_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for qi, query in enumerate(queries):
+            rows = np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in probes[qi]])
+            if not len(rows):
+                continue
+            indices, scores = _top_k_rows((self.embeddings[rows] @ query)[None, :], k)
+            all_indices[qi, :indices.shape[1]] = rows[indices[0]]
+            all_scores[qi, :scores.shape[1]] = scores[0]
+        return all_indices, all_scores
+
+
+def load_vector_index(embeddings, base_path=None, kind=None):
+    """Pick the index for a table: IVF for large tables with a built index, else brute force."""
+    kind = kind or os.getenv("FOOD_VECTOR_INDEX", "auto")
+    if kind == "brute" or base_path is None:
+        return BruteForceIndex(embeddings)
+    if IVFIndex.exists(base_path) and (kind == "ivf" or len(embeddings) >= ANN_MIN_ROWS):
+        return IVFIndex.load(embeddings, base_path)
+    if kind == "ivf" or len(embeddings) >= ANN_MIN_ROWS:
+        print(f"⚠️ No IVF index at {base_path}; using brute force. Build it with: python vector_index.py build <csv>")
+    return BruteForceIndex(embeddings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the ANN index for a food database CSV.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build")
+    build.add_argument("csv_path")
+    build.add_argument("--nlist", type=int, default=None)
+    build.add_argument("--iterations", type=int, default=10)
+    args = parser.parse_args()
+
+    from swiss_food_matcher import index_base_path, load_embedding_index
+
+    _, _, embeddings, _ = load_embedding_index(args.csv_path)
+    start = time.perf_counter()
+    index = IVFIndex.build(embeddings, nlist=args.nlist, iterations=args.iterations)
+    index.save(index_base_path(args.csv_path))
+    print(f"🧱 Built IVF index ({len(index.centroids)} lists, {len(embeddings)} rows) "
+          f"in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
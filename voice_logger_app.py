@@ -1,70 +1,18 @@
 # Save this file as voice_logger_app.py and run with: streamlit run voice_logger_app.py
 
 import streamlit as st
-import os
-import tempfile
-import subprocess
 import json
 import pandas as pd
 from datetime import datetime
-import numpy as np
-import re
-from word2number import w2n
-import requests
 
-from openai_stt import transcribe_with_openai
-from entity_extractor import extract_food_entities
-from swiss_food_matcher import load_food_database, match_entity
+from app_resources import get_food_db, get_meal_state, process_audio, start_warm_up
+from highlighter import highlight_transcript
+from json_utils import clean_list_for_json
+from log_sink import get_log_sink
+from meal_store import get_meal_store
+from number_normalizer import normalize_numbers
 
 # --- Helpers ---
-def normalize_numbers(text):
-    words = text.split()
-    converted = []
-    for word in words:
-        try:
-            converted.append(str(w2n.word_to_num(word)))
-        except:
-            converted.append(word)
-    return ' '.join(converted)
-
-def highlight_transcript(text, entities):
-    text = normalize_numbers(text)
-    highlighted = text
-    entities_sorted = sorted(entities, key=lambda e: -len(str(e.get("extracted", ""))))
-    vague_terms = {"some", "few", "several"}
-
-    for ent in entities_sorted:
-        food = str(ent.get("extracted", "")).strip()
-        quantity = str(ent.get("quantity", "")).strip()
-        unit = str(ent.get("unit", "")).strip()
-
-        if quantity.lower() in vague_terms:
-            highlighted = re.sub(rf"\b{re.escape(quantity)}\b",
-                                 r'<span style="background-color:#ffff99;">\g<0></span>', highlighted, flags=re.IGNORECASE)
-        elif quantity and unit:
-            highlighted = re.sub(rf"\b{re.escape(quantity)}\s+{re.escape(unit)}\b",
-                                 r'<span style="background-color:#40e0d0;">\g<0></span>', highlighted, flags=re.IGNORECASE)
-        elif quantity:
-            highlighted = re.sub(rf"\b{re.escape(quantity)}\b",
-                                 r'<span style="background-color:#40e0d0;">\g<0></span>', highlighted, flags=re.IGNORECASE)
-
-        if food:
-            highlighted = re.sub(rf"\b{re.escape(food)}\b",
-                                 r'<span style="background-color:#90ee90;">\g<0></span>', highlighted, flags=re.IGNORECASE)
-    return highlighted
-
-def make_json_serializable(obj):
-    if isinstance(obj, np.generic): return obj.item()
-    elif isinstance(obj, datetime): return obj.isoformat()
-    elif isinstance(obj, set): return list(obj)
-    return str(obj)
-
-def clean_list_for_json(data):
-    return json.loads(json.dumps(data, default=make_json_serializable))
-
-def convert_to_mp3(input_path, output_path):
-    subprocess.run(["ffmpeg", "-y", "-i", input_path, output_path], check=True)
-
 def send_to_google_sheets(meal_id, user_id, raw_text, entities, matches, prompts):
     url = "https://script.google.com/macros/s/AKfycbwxZT_5PtOTEZpYbOsNINwDUjwHOAw7Nzm21-UfrDZsBsuojWl48wXKO1-Xvrlx_XQ7zA/exec"
     payload = {
@@ -75,14 +23,9 @@ def send_to_google_sheets(meal_id, user_id, raw_text, entities, matches, prompts
         "matches": matches,
         "prompts": prompts,
     }
-    try:
-        cleaned = clean_list_for_json(payload)
-        response = requests.post(url, json=cleaned)
-        response.raise_for_status()
-        st.success("✅ Logged to Google Sheets!")
-    except Exception as e:
-        st.error("❌ Google Sheets logging failed.")
-        st.exception(e)
+    # Local history first (an upsert by meal_id), then the sheet via a background thread
+    get_meal_store().put(payload)
+    get_log_sink(url).log(payload)
 
 # --- App config ---
 now = datetime.now().strftime("%Y-%m-%d %H:%M")
@@ -96,77 +39,74 @@ The system will transcribe it, extract food items, and ask for clarification if
 """)
 
 # --- Load Swiss DB ---
-db_path = os.path.join(os.path.dirname(__file__), "swiss_food_composition_database_small.csv")
-FOOD_DB = load_food_database(db_path)
+start_warm_up()
+FOOD_DB = get_food_db()
 
 # --- Session state ---
-for key in ["transcript", "entities", "clarified_entities", "matched_entities"]:
+for key in ["transcript", "entities"]:
     if key not in st.session_state:
         st.session_state[key] = []
 
 # --- Voice Input ---
 voice_file = st.file_uploader("Upload your voice log", type=["mp3", "wav", "ogg", "mp4"])
 if voice_file:
-    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(voice_file.name)[1]) as tmp:
-        tmp.write(voice_file.read())
-        tmp_path = tmp.name
-    converted_path = tmp_path + ".converted.mp3"
-    convert_to_mp3(tmp_path, converted_path)
     with st.spinner("Transcribing..."):
-        transcript = transcribe_with_openai(converted_path)
-    st.session_state.transcript = transcript
-    st.session_state.entities, _ = extract_food_entities(transcript)
-    st.session_state.clarified_entities = []
-    st.session_state.matched_entities = []
+        meal = process_audio(voice_file.getvalue(), voice_file.name)
+    if meal["error"]:
+        st.error(f"❌ Processing failed: {meal['error']}")
+        st.stop()
+    st.session_state.transcript = meal["transcript"]
+    st.session_state.meal_id = meal["meal_id"]
+    st.session_state.entities = meal["entities"]
 
 # --- Clarify and Match ---
-for entity in st.session_state.entities[len(st.session_state.clarified_entities):]:
-    extracted = entity["extracted"]
-    quantity = entity.get("quantity")
-    unit = entity.get("unit")
-
-    if isinstance(quantity, str) and quantity.lower() in ["a", "an", "one"]:
-        quantity = 1
-    elif isinstance(quantity, str) and quantity.lower() in ["some", "few", "several"]:
-        quantity = None
-        unit = None
-
-    if not quantity or quantity == 0:
-        quantity = st.number_input(f"How much {extracted}?", min_value=0.0, key=f"q_{extracted}")
-    if not unit or unit.strip() == "":
-        unit = st.text_input(f"Unit for {extracted}?", value="portion", key=f"unit_{extracted}")
-
-    clarified = {"extracted": extracted, "quantity": quantity, "unit": unit}
-    st.session_state.clarified_entities.append(clarified)
-
-    match = match_entity(clarified, FOOD_DB)
-    if match["score"] < 0.7 or not match["recognized"]:
-        correction = st.text_input(f"'{extracted}' not recognized. What did you mean?", key=f"corr_{extracted}")
-        if correction:
-            match = match_entity({"extracted": correction, "quantity": quantity, "unit": unit}, FOOD_DB)
-
-    st.session_state.matched_entities.append(match)
+# Clarification state lives across reruns; only entities whose inputs change are redone
+state = None
+if st.session_state.entities:
+    state = get_meal_state(st.session_state.meal_id, st.session_state.transcript, st.session_state.entities)
+
+    for entity in state.active():
+        quantity = entity.given_quantity
+        unit = None if entity.vague else entity.given_unit
+        if not quantity:
+            quantity = st.number_input(f"How much {entity.extracted}?", min_value=0.0, key=f"q_{entity.key}")
+        if not unit:
+            unit = st.text_input(f"Unit for {entity.extracted}?", value="portion", key=f"unit_{entity.key}")
+        entity.clarify(quantity, unit)
+    state.match_pending(FOOD_DB)
+
+    for entity in state.active():
+        if not entity.recognized:
+            correction = st.text_input(f"'{entity.extracted}' not recognized. What did you mean?",
+                                       key=f"corr_{entity.key}")
+            entity.correct(correction)
+    state.match_pending(FOOD_DB)
 
 # --- Output ---
-if st.session_state.matched_entities:
-    df = pd.DataFrame(st.session_state.matched_entities)
+if state is not None and state.matched_entities():
+    matched_entities = state.matched_entities()
+    df = pd.DataFrame(matched_entities)
     st.subheader("📋 Matched Table")
     st.dataframe(df[["extracted", "recognized", "quantity", "unit", "ID"]])
 
     st.subheader("📝 Highlighted Transcript")
-    st.markdown(highlight_transcript(st.session_state.transcript, st.session_state.clarified_entities), unsafe_allow_html=True)
-
-    send_to_google_sheets(
-        meal_id=f"meal_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
-        user_id="anon_user",
-        raw_text=st.session_state.transcript,
-        entities=st.session_state.clarified_entities,
-        matches=clean_list_for_json(st.session_state.matched_entities),
-        prompts=[],
-    )
+    st.markdown(highlight_transcript(normalize_numbers(st.session_state.transcript),
+                                    state.clarified_entities()), unsafe_allow_html=True)
+
+    # Logged once per change, not on every rerun
+    if state.needs_logging():
+        send_to_google_sheets(
+            meal_id=st.session_state.meal_id,
+            user_id="anon_user",
+            raw_text=st.session_state.transcript,
+            entities=state.clarified_entities(),
+            matches=clean_list_for_json(matched_entities),
+            prompts=[],
+        )
+        state.mark_logged()
 
     st.success("✅ Thank you for using the Pathmate Voice-Based Meal Logger!")
-    st.download_button("📥 Download JSON", data=json.dumps(clean_list_for_json(st.session_state.matched_entities), indent=2),
+    st.download_button("📥 Download JSON", data=json.dumps(clean_list_for_json(matched_entities), indent=2),
                        file_name="meal_log.json", mime="application/json")
     st.download_button("📥 Download CSV", data=df.to_csv(index=False), file_name="meal_log.csv", mime="text/csv")
 
@@ -1,27 +1,140 @@
+import copy
 import os
+import queue
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
 from ibm_watson import SpeechToTextV1
+from ibm_watson.websocket import AudioSource, RecognizeCallback
 from ibm_cloud_sdk_core.authenticators import IAMAuthenticator
 from dotenv import load_dotenv
 
+from transcript_cache import cached_transcription
+
 load_dotenv()
 
-def get_speech_to_text_service():
-    authenticator = IAMAuthenticator(os.getenv("WATSON_API_KEY"))
+WATSON_MODEL = "en-US_BroadbandModel"
+WATSON_POOL_SIZE = int(os.getenv("WATSON_POOL_SIZE", "10"))
+CONTENT_TYPES = {".mp3": "audio/mp3", ".wav": "audio/wav", ".ogg": "audio/ogg", ".flac": "audio/flac", ".webm": "audio/webm"}
+
+_service = None
+_service_lock = threading.Lock()
+_DONE = object()
+
+
+def _create_speech_to_text_service():
+    # WATSON_IAM_URL lets tests point token requests at a local mock
+    authenticator = IAMAuthenticator(os.getenv("WATSON_API_KEY"), url=os.getenv("WATSON_IAM_URL"))
     speech_to_text = SpeechToTextV1(authenticator=authenticator)
     speech_to_text.set_service_url(os.getenv("WATSON_URL"))
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=WATSON_POOL_SIZE, pool_maxsize=WATSON_POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    speech_to_text.set_http_client(session)
     return speech_to_text
 
+def get_speech_to_text_service():
+    # One long-lived client: the authenticator reuses its IAM token until it
+    # nears expiry and the session keeps connections to Watson open
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = _create_speech_to_text_service()
+        return _service
+
+def _content_type(file_path):
+    return CONTENT_TYPES.get(os.path.splitext(file_path)[1].lower(), "audio/mp3")
+
+@cached_transcription(f"watson:{WATSON_MODEL}")
 def transcribe_audio(file_path: str) -> str:
     stt_service = get_speech_to_text_service()
     with open(file_path, 'rb') as audio_file:
         result = stt_service.recognize(
             audio=audio_file,
-            content_type='audio/mp3',
-            model='en-US_BroadbandModel',
+            content_type=_content_type(file_path),
+            model=WATSON_MODEL,
             smart_formatting=True
         ).get_result()
-        
+
     if result.get("results"):
         return " ".join([r["alternatives"][0]["transcript"] for r in result["results"]])
     else:
         return "No transcription available."
+
+
+class _QueueCallback(RecognizeCallback):
+    def __init__(self, results):
+        super().__init__()
+        self.results = results
+
+    def on_data(self, data):
+        for result in data.get("results", []):
+            self.results.put({
+                "transcript": result["alternatives"][0]["transcript"],
+                "final": result.get("final", False),
+            })
+
+    def on_error(self, error):
+        self.results.put(RuntimeError(f"Watson streaming error: {error}"))
+
+
+def _websocket_service(service):
+    # The SDK only rewrites https:// to wss://; plain-HTTP mock endpoints need ws://
+    if service.service_url.startswith("http:"):
+        service = copy.copy(service)
+        service.service_url = "ws:" + service.service_url[len("http:"):]
+    return service
+
+def stream_transcription(audio, content_type=None, interim_results=True):
+    """Yield {"transcript", "final"} results while the audio is still being sent.
+
+    audio is a file path or an iterable of byte chunks (e.g. a live recording).
+    """
+    results = queue.Queue()
+    if content_type is None:
+        content_type = _content_type(audio) if isinstance(audio, str) else "audio/mp3"
+
+    audio_file = None
+    if isinstance(audio, str):
+        audio_file = open(audio, "rb")
+        source = AudioSource(audio_file)
+    else:
+        buffer = queue.Queue()
+        source = AudioSource(buffer, is_recording=True, is_buffer=True)
+
+        def feed():
+            for chunk in audio:
+                buffer.put(chunk)
+            source.completed_recording()
+
+        threading.Thread(target=feed, daemon=True).start()
+
+    def recognize():
+        try:
+            _websocket_service(get_speech_to_text_service()).recognize_using_websocket(
+                audio=source,
+                content_type=content_type,
+                recognize_callback=_QueueCallback(results),
+                model=WATSON_MODEL,
+                interim_results=interim_results,
+                smart_formatting=True
+            )
+        except Exception as e:
+            results.put(e)
+        finally:
+            # The recognize thread owns the file; close it however the stream ended
+            if audio_file is not None:
+                audio_file.close()
+            results.put(_DONE)
+
+    threading.Thread(target=recognize, daemon=True).start()
+    while True:
+        item = results.get()
+        if item is _DONE:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item